@@ -1,5 +1,11 @@
 import numpy as np
 
+from geometry.data_structures.curve import sub_divide_steps
+from geometry.utils import instrumentation
+
+# Upper bound on the number of DP cells held in memory by discrete_frechet_segments
+MAX_BATCH_CELLS = 2 ** 20
+
 
 def discrete_frechet(p, q):
     """
@@ -10,43 +16,242 @@ def discrete_frechet(p, q):
     between polygonal curves p and q in O(|p| * |q|) time, where |x|
     denotes the number of vertices in a polygonal curve.
     """
-    ca = [[-1.0 for _ in range(0, q.size())] for _ in range(0, p.size())]
+    return discrete_frechet_array(p.as_array(), q.as_array())
+
+
+def discrete_frechet_array(p, q):
+    """
+    Computes the discrete Frechet distance between the curves whose vertices are
+    given by the (n, 2) and (m, 2) coordinate arrays p and q.
+
+    The dynamic program is swept iteratively one anti-diagonal at a time: every cell
+    on anti-diagonal k only depends on anti-diagonals k - 1 and k - 2, so each sweep
+    step is a single vectorized operation and only O(min(n, m)) memory is used.
+
+    Note that, as in discrete_frechet, indices follow Table 1 of the paper, which is
+    1-based. The first vertex of each curve therefore does not take part in the coupling.
+    """
+    p = np.asarray(p, dtype=np.float64)[1:]
+    q = np.asarray(q, dtype=np.float64)[1:]
+
+    if instrumentation.STATS is not None:
+        instrumentation.STATS.count('discrete_frechet_calls')
+
+    if len(p) == 0 or len(q) == 0:
+        return float('inf')
+
+    # The recurrence is symmetric, so index the anti-diagonals by the shorter curve
+    if len(q) < len(p):
+        p, q = q, p
+
+    n = len(p)
+    m = len(q)
+
+    # Slot i + 1 holds the coupling cost of row i; slot 0 is a permanent sentinel
+    prev2 = np.full(n + 1, np.inf)
+    prev1 = np.full(n + 1, np.inf)
+    curr = np.full(n + 1, np.inf)
+
+    for k in range(0, n + m - 1):
+        lo = max(0, k - m + 1)
+        hi = min(k, n - 1) + 1
+
+        d = p[lo:hi] - q[k - hi + 1:k - lo + 1][::-1]
+        d = np.sqrt(d[:, 0] ** 2 + d[:, 1] ** 2)
+
+        curr.fill(np.inf)
+        if k == 0:
+            curr[1] = d[0]
+        else:
+            # Cells (i - 1, j), (i, j - 1) and (i - 1, j - 1) respectively
+            reach = np.minimum(np.minimum(prev1[lo:hi], prev1[lo + 1:hi + 1]), prev2[lo:hi])
+            curr[lo + 1:hi + 1] = np.maximum(reach, d)
+
+        prev2, prev1, curr = prev1, curr, prev2
+
+    return float(prev1[n])
+
+
+def discrete_frechet_segments(starts, ends, curve, d_t, max_cells=MAX_BATCH_CELLS):
+    """
+    Computes, for every segment (starts[b], ends[b]), the discrete Frechet distance between
+    the segment sub-divided into pieces of length d_t and the (n, 2) array of curve vertices.
+    Returns an array holding one distance per segment.
+
+    Segments are processed in chunks that share one anti-diagonal sweep over the curve, so the
+    points of each sub-divided segment are generated on the fly and never materialized as curves.
+    Each chunk holds at most max_cells DP cells. Segments are sorted by their number of Steiner
+    points so that segments in the same chunk need a similar number of anti-diagonals.
+    """
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    curve = np.asarray(curve, dtype=np.float64)[1:]
+    distances = np.full(len(starts), np.inf)
+
+    if instrumentation.STATS is not None:
+        instrumentation.STATS.count('discrete_frechet_calls')
+        instrumentation.STATS.count('discrete_frechet_segments', len(starts))
+
+    if len(curve) == 0:
+        return distances
+
+    t, counts = sub_divide_steps(np.sqrt(np.sum((ends - starts) ** 2, axis=1)), d_t)
+
+    # Segment b contributes counts[b] + 1 points once its first point is dropped
+    order = np.argsort(counts, kind='mergesort')
+    chunk = max(1, max_cells // (len(curve) + 1))
 
-    def distance(p1, p2):
-        return np.linalg.norm(p1.v - p2.v)
+    for c in range(0, len(order), chunk):
+        batch = order[c:c + chunk]
+        distances[batch] = _sweep_segments(starts[batch], ends[batch], t[batch], counts[batch] + 1, curve)
 
-    def __c(i, j):
-        if ca[i][j] > -1.0:
-            return ca[i][j]
+    return distances
 
-        elif i == 1 and j == 1:
-            ca[i][j] = distance(p.get_point(1), q.get_point(1))
 
-        elif i > 1 and j == 1:
-            ca[i][j] = max(
-                __c(i - 1, 1),
-                distance(p.get_point(i), q.get_point(1))
-            )
+def _sweep_segments(starts, ends, t, sizes, curve):
+    n = len(curve)
+    m = int(sizes.max())
+    batch = len(starts)
+    ends_at = n + sizes - 2
+    result = np.empty(batch)
 
-        elif i == 1 and j > 1:
-            ca[i][j] = max(
-                __c(1, j - 1),
-                distance(p.get_point(1), q.get_point(j))
-            )
+    prev2 = np.full((batch, n + 1), np.inf)
+    prev1 = np.full((batch, n + 1), np.inf)
+    curr = np.full((batch, n + 1), np.inf)
 
-        elif i > 1 and j > 1:
-            ca[i][j] = max(
-                min(
-                    __c(i - 1, j),
-                    __c(i - 1, j - 1),
-                    __c(i, j - 1)
-                ),
-                distance(p.get_point(i), q.get_point(j))
-            )
+    for k in range(0, n + m - 1):
+        lo = max(0, k - m + 1)
+        hi = min(k, n - 1) + 1
 
+        # Steiner point j + 1 of every segment, clamped to the segment's last point
+        j = k - np.arange(lo, hi) + 1
+        s = np.minimum(j[None, :] * t[:, None], 1)
+        s[j[None, :] >= sizes[:, None]] = 1
+
+        x = (1 - s) * starts[:, 0, None] + s * ends[:, 0, None] - curve[lo:hi, 0]
+        y = (1 - s) * starts[:, 1, None] + s * ends[:, 1, None] - curve[lo:hi, 1]
+        d = np.sqrt(x ** 2 + y ** 2)
+
+        curr.fill(np.inf)
+        if k == 0:
+            curr[:, 1] = d[:, 0]
         else:
-            ca[i][j] = float('inf')
+            reach = np.minimum(np.minimum(prev1[:, lo:hi], prev1[:, lo + 1:hi + 1]), prev2[:, lo:hi])
+            curr[:, lo + 1:hi + 1] = np.maximum(reach, d)
+
+        done = ends_at == k
+        result[done] = curr[done, n]
+
+        prev2, prev1, curr = prev1, curr, prev2
+
+    return result
+
+
+def continuous_frechet_segments(starts, ends, curve, max_cells=MAX_BATCH_CELLS):
+    """
+    Computes, for every segment (starts[b], ends[b]), the continuous Frechet distance between
+    the segment and the polygonal curve whose vertices are given by the (n, 2) array curve.
+    Returns an array holding one distance per segment.
+
+    Follows the free space characterisation of Computing the Frechet Distance Between Two
+    Polygonal Curves by Helmut Alt and Michael Godau, specialised to a single segment. Every
+    vertex p_i of the curve is matched to an interval [l_i, r_i] of the segment and the free
+    space of each cell is convex, so the distance is at most eps if and only if the endpoints
+    are within eps of each other and the intervals admit a non-decreasing choice of points,
+    which holds when max(l_1, ..., l_i) <= r_i for every i. Each such decision takes O(n) time.
+
+    The critical values where an interval becomes non-empty give an exact lower bound that
+    settles most segments outright. The remaining segments are bisected between the lower bound
+    and a trivially feasible upper bound, after which the critical value l_i = r_j of the
+    violating pair of vertices, found where the bisector of p_i and p_j crosses the segment, is
+    returned. Rather than the parametric search of the paper, the search stops after a fixed
+    number of O(n) decisions, so the cost does not depend on the scale of the coordinates.
+    """
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    curve = np.asarray(curve, dtype=np.float64)
+    distances = np.empty(len(starts))
+
+    if instrumentation.STATS is not None:
+        instrumentation.STATS.count('continuous_frechet_segments', len(starts))
+
+    chunk = max(1, max_cells // len(curve))
+    for c in range(0, len(starts), chunk):
+        distances[c:c + chunk] = _continuous_segments(starts[c:c + chunk], ends[c:c + chunk], curve)
+
+    return distances
+
+
+def _continuous_segments(a, b, curve, iterations=64):
+    direction = b - a
+    length_sq = np.sum(direction ** 2, axis=1)[:, None]
+    degenerate = length_sq == 0
+    length_sq = np.where(degenerate, 1, length_sq)
+
+    # Position of each vertex's projection on the segment's line, and its squared distance to it
+    inner = curve[1:-1]
+    dx = inner[None, :, 0] - a[:, 0, None]
+    dy = inner[None, :, 1] - a[:, 1, None]
+    proj = np.where(degenerate, 0, (dx * direction[:, 0, None] + dy * direction[:, 1, None]) / length_sq)
+    height_sq = np.maximum(dx ** 2 + dy ** 2 - proj ** 2 * length_sq, 0)
+    clamped = np.clip(proj, 0, 1)
+
+    lower = np.maximum(
+        np.hypot(curve[0, 0] - a[:, 0], curve[0, 1] - a[:, 1]),
+        np.hypot(curve[-1, 0] - b[:, 0], curve[-1, 1] - b[:, 1])
+    )
+
+    if len(inner) == 0:
+        return lower
+
+    to_segment = np.sqrt(height_sq + (proj - clamped) ** 2 * length_sq)
+    lower = np.maximum(lower, to_segment.max(axis=1))
+
+    def intervals(rows, eps):
+        width = np.sqrt(np.maximum(eps[:, None] ** 2 - height_sq[rows], 0) / length_sq[rows])
+        width[degenerate[rows, 0]] = 1
+        return np.maximum(proj[rows] - width, 0), np.minimum(proj[rows] + width, 1)
+
+    def decide(rows, eps):
+        l, r = intervals(rows, eps)
+        return np.all(np.maximum.accumulate(l, axis=1) <= r + 1e-12, axis=1)
+
+    result = lower.copy()
+    rows = np.flatnonzero(~decide(np.arange(len(a)), lower))
+
+    if len(rows) == 0:
+        return result
+
+    # Every interval is [0, 1] once eps reaches both endpoints of the segment from every vertex
+    lo = lower[rows]
+    hi = np.maximum(
+        np.sqrt(dx[rows] ** 2 + dy[rows] ** 2).max(axis=1),
+        np.hypot(inner[None, :, 0] - b[rows, 0, None], inner[None, :, 1] - b[rows, 1, None]).max(axis=1)
+    )
+    hi = np.maximum(hi, lo)
+
+    for _ in range(0, iterations):
+        mid = (lo + hi) / 2
+        feasible = decide(rows, mid)
+        hi = np.where(feasible, mid, hi)
+        lo = np.where(feasible, lo, mid)
+
+    # The first violated vertex j and the vertex i < j whose interval starts furthest along
+    l, r = intervals(rows, lo)
+    prefix = np.maximum.accumulate(l, axis=1)
+    j = np.argmax(prefix > r + 1e-12, axis=1)
+    i = np.argmax(np.where(np.arange(len(inner)) <= j[:, None], l, -np.inf), axis=1)
+
+    p_i = inner[i]
+    p_j = inner[j]
+    ai_sq = np.sum((a[rows] - p_i) ** 2, axis=1)
+    aj_sq = np.sum((a[rows] - p_j) ** 2, axis=1)
+    denominator = 2 * np.sum(direction[rows] * (p_j - p_i), axis=1)
+    t = np.clip((aj_sq - ai_sq) / np.where(denominator != 0, denominator, -1), 0, 1)
 
-        return ca[i][j]
+    x = a[rows] + t[:, None] * direction[rows]
+    candidate = np.maximum(np.hypot(*(x - p_i).T), np.hypot(*(x - p_j).T))
+    candidate = np.maximum(candidate, lower[rows])
 
-    return __c(p.size() - 1, q.size() - 1)
+    result[rows] = np.where(decide(rows, candidate) & (candidate <= hi), candidate, hi)
+    return result
@@ -0,0 +1,7 @@
+"""
+Reproducible performance benchmarks, run with python -m geometry.bench.
+
+Every benchmark builds its inputs with the seeded generators of geometry.bench.generators and
+reports the best and median of several timed repetitions, along with metrics describing the work
+done, as JSON. Two reports can be compared with --compare to spot regressions between runs.
+"""
@@ -0,0 +1,54 @@
+import argparse
+import json
+import platform
+import sys
+
+import numpy as np
+
+from geometry.bench.benchmarks import BENCHMARKS, SCALES, compare, run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m geometry.bench', description='Runs the performance benchmarks.')
+    parser.add_argument('benchmarks', nargs='*', help='benchmarks to run, all of them by default: {}'.format(
+        ', '.join(sorted(BENCHMARKS))))
+    parser.add_argument('--scale', choices=sorted(SCALES), default='quick', help='size of the parameter sweeps')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the input generators')
+    parser.add_argument('--repeat', type=int, default=3, help='timed repetitions of every measurement')
+    parser.add_argument('--output', help='file the JSON report is written to, standard output by default')
+    parser.add_argument('--compare', help='JSON report of a previous run to compare the timings with')
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if len(unknown) > 0:
+        parser.error('unknown benchmarks: {}'.format(', '.join(unknown)))
+
+    report = {
+        'version': 1,
+        'scale': args.scale,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'results': run(args.benchmarks, args.scale, args.seed, args.repeat)
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        for name, params, before, after, ratio in compare(baseline['results'], report['results']):
+            sys.stderr.write('{:<24} {:<60} {:>10.4f}s {:>10.4f}s {:>7.2f}x\n'.format(
+                name, json.dumps(params, sort_keys=True), before, after, ratio))
+
+
+if __name__ == '__main__':
+    main()
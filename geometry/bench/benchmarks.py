@@ -0,0 +1,206 @@
+from __future__ import division
+
+from timeit import default_timer
+
+import numpy as np
+
+from geometry.algorithms.frechet_distance import discrete_frechet
+from geometry.bench.generators import curve_queries, linked_tree, random_walk, road_tree, spiral
+from geometry.data_structures.curve import Edge2D
+from geometry.data_structures.curve_range_tree import CurveRangeTree2D
+from geometry.data_structures.exponential_grid import ExponentialGrid2D
+from geometry.data_structures.frechet_grid import FrechetGrid2D
+from geometry.data_structures.frechet_tree import FrechetTree
+from geometry.data_structures.point import Point2D
+from geometry.data_structures.tree import ArrayTree
+from geometry.utils.cache import TABLE_CACHE
+
+CURVES = {
+    'random_walk': random_walk,
+    'spiral': spiral
+}
+
+# The parameters swept by every benchmark, at the quick and full scales
+SCALES = {
+    'quick': {
+        'discrete_frechet': {'n': [50, 100]},
+        'exponential_grid': {'error': [1.0, 0.5]},
+        'frechet_grid': {'n': [8], 'error': [1.0]},
+        'curve_range_tree_build': {'n': [8, 16], 'error': [1.0]},
+        'curve_range_tree_query': {'n': [16], 'error': [1.0], 'delta': [1.0], 'queries': [20]},
+        'tree_decompose': {'n': [1000, 10000]},
+        'frechet_tree': {'n': [16], 'error': [1.0], 'delta': [1.0]}
+    },
+    'full': {
+        'discrete_frechet': {'n': [100, 300, 1000, 3000]},
+        'exponential_grid': {'error': [1.0, 0.5, 0.25, 0.1]},
+        'frechet_grid': {'n': [8, 32, 128], 'error': [1.0, 0.75]},
+        'curve_range_tree_build': {'n': [16, 32, 64], 'error': [1.0, 0.75]},
+        'curve_range_tree_query': {'n': [32, 64], 'error': [1.0], 'delta': [0.5, 1.0, 2.0], 'queries': [100]},
+        'tree_decompose': {'n': [10000, 100000, 1000000]},
+        'frechet_tree': {'n': [32, 64], 'error': [1.0], 'delta': [1.0]}
+    }
+}
+
+
+def timed(f, repeat):
+    """
+    Calls f repeat times, returning the best and median times in seconds along with the last result.
+    """
+    times = list()
+    result = None
+    for _ in range(0, repeat):
+        start = default_timer()
+        result = f()
+        times.append(default_timer() - start)
+
+    return min(times), float(np.median(times)), result
+
+
+def bench_discrete_frechet(params, seed, repeat):
+    for curve in CURVES:
+        for n in params['n']:
+            p = CURVES[curve](n, seed)
+            q = CURVES[curve](n, seed + 1)
+            best, median, distance = timed(lambda: discrete_frechet(p, q), repeat)
+            yield {'curve': curve, 'n': n}, best, median, {'distance': distance}
+
+
+def bench_exponential_grid(params, seed, repeat):
+    rng = np.random.RandomState(seed)
+    for error in params['error']:
+        # FrechetGrid2D bounds its grids by alpha = error * L / 2 and beta = L / error, here with L = 1
+        alpha = error / 2
+        beta = 1 / error
+        best, median, grid = timed(lambda: ExponentialGrid2D(Point2D(0.0, 0.0), error, alpha, beta), repeat)
+
+        angles = rng.uniform(0, 2 * np.pi, 10000)
+        radii = rng.uniform(alpha, beta, 10000)
+        points = np.stack((radii * np.cos(angles), radii * np.sin(angles)), axis=1)
+        query, _, _ = timed(lambda: grid.approximate_indices(points), repeat)
+
+        yield {'error': error}, best, median, {'grid_points': len(grid),
+                                                 'query_seconds_per_point': query / len(points)}
+
+
+def bench_frechet_grid(params, seed, repeat):
+    for curve in CURVES:
+        for n in params['n']:
+            for error in params['error']:
+                c = CURVES[curve](n, seed)
+                best, median, grid = timed(lambda: FrechetGrid2D(c, error), repeat)
+                yield {'curve': curve, 'n': n, 'error': error}, best, median, \
+                    {'table_cells': int(grid.distances.size) if grid.distances is not None else 0}
+
+
+def bench_curve_range_tree_build(params, seed, repeat):
+    for curve in CURVES:
+        for n in params['n']:
+            for error in params['error']:
+                c = CURVES[curve](n, seed)
+                best, median, tree = timed(lambda: CurveRangeTree2D(c, error, 1.0), repeat)
+                yield {'curve': curve, 'n': n, 'error': error}, best, median, \
+                    {'nodes': len(list(tree.post_order_traversal(tree.root)))}
+
+
+def bench_curve_range_tree_query(params, seed, repeat):
+    for curve in CURVES:
+        for n in params['n']:
+            for error in params['error']:
+                for delta in params['delta']:
+                    for m in params['queries']:
+                        c = CURVES[curve](n, seed)
+                        tree = CurveRangeTree2D(c, error, delta)
+                        q_edges, xs, ys, x_edges, y_edges = curve_queries(c, m, delta, seed)
+
+                        def single():
+                            return [tree.is_approximate(_edge(q_edges[k]), Point2D(*xs[k]), Point2D(*ys[k]),
+                                                        _edge(x_edges[k]), _edge(y_edges[k]))
+                                    for k in range(0, m)]
+
+                        best, median, answers = timed(single, repeat)
+                        batch, _, _ = timed(lambda: tree.is_approximate_many(q_edges, xs, ys, x_edges, y_edges),
+                                            repeat)
+                        yield {'curve': curve, 'n': n, 'error': error, 'delta': delta, 'queries': m}, \
+                            best, median, {'seconds_per_query': best / m, 'batch_seconds_per_query': batch / m,
+                                           'positive': int(np.sum(answers))}
+
+
+def bench_tree_decompose(params, seed, repeat):
+    for n in params['n']:
+        coordinates, parents = road_tree(n, seed)
+
+        best, median, _ = timed(lambda: ArrayTree(coordinates, parents).decompose(lca_index=True), repeat)
+        tree = ArrayTree(coordinates, parents)
+        paths = tree.decompose()
+        yield {'tree': 'array', 'n': n}, best, median, {'paths': len(paths), 'height': int(np.max(tree.depths))}
+
+        # Linked trees are far slower, so they are only timed at the smaller sizes
+        if n <= 100000:
+            tree = linked_tree(coordinates, parents)
+            best, median, paths = timed(lambda: tree.decompose(lca_index=True), repeat)
+            yield {'tree': 'linked', 'n': n}, best, median, {'paths': len(paths)}
+
+
+def bench_frechet_tree(params, seed, repeat):
+    for n in params['n']:
+        for error in params['error']:
+            for delta in params['delta']:
+                coordinates, parents = road_tree(n, seed)
+                best, median, tree = timed(
+                    lambda: FrechetTree(linked_tree(coordinates, parents), error, delta), repeat)
+                yield {'n': n, 'error': error, 'delta': delta}, best, median, {'paths': len(tree.path_trees)}
+
+
+BENCHMARKS = {
+    'discrete_frechet': bench_discrete_frechet,
+    'exponential_grid': bench_exponential_grid,
+    'frechet_grid': bench_frechet_grid,
+    'curve_range_tree_build': bench_curve_range_tree_build,
+    'curve_range_tree_query': bench_curve_range_tree_query,
+    'tree_decompose': bench_tree_decompose,
+    'frechet_tree': bench_frechet_tree
+}
+
+
+def run(names=None, scale='quick', seed=0, repeat=3):
+    """
+    Runs the named benchmarks, all of them by default, returning one result per swept parameter set.
+    """
+    results = list()
+    for name in names or BENCHMARKS:
+        TABLE_CACHE.clear()
+        for params, best, median, metrics in BENCHMARKS[name](SCALES[scale][name], seed, repeat):
+            results.append({
+                'benchmark': name,
+                'params': params,
+                'seconds': best,
+                'median_seconds': median,
+                'metrics': metrics
+            })
+
+    return results
+
+
+def compare(baseline, results):
+    """
+    Matches results with the baseline results having the same benchmark and parameters, returning
+    (benchmark, params, baseline seconds, seconds, ratio) for each match.
+    """
+    def key(result):
+        return result['benchmark'], tuple(sorted(result['params'].items()))
+
+    previous = dict((key(result), result) for result in baseline)
+    rows = list()
+    for result in results:
+        other = previous.get(key(result))
+        if other is not None:
+            rows.append((result['benchmark'], result['params'], other['seconds'], result['seconds'],
+                         result['seconds'] / other['seconds'] if other['seconds'] > 0 else float('inf')))
+
+    return rows
+
+
+def _edge(coordinates):
+    (p1_x, p1_y), (p2_x, p2_y) = coordinates.tolist()
+    return Edge2D(Point2D(p1_x, p1_y), Point2D(p2_x, p2_y))
@@ -0,0 +1,99 @@
+from __future__ import division
+
+import numpy as np
+
+from geometry.data_structures.curve import ArrayCurve2D
+from geometry.data_structures.tree import Tree
+
+
+def random_walk(n, seed=0, step=1.0, turn=0.5):
+    """
+    Returns a curve of n vertices taking steps of the given length, whose heading changes by a
+    normally distributed angle of standard deviation turn at every vertex.
+    """
+    rng = np.random.RandomState(seed)
+    headings = np.cumsum(rng.normal(0, turn, n - 1))
+    steps = step * np.stack((np.cos(headings), np.sin(headings)), axis=1)
+    return ArrayCurve2D(np.concatenate(([[0.0, 0.0]], np.cumsum(steps, axis=0))))
+
+
+def spiral(n, seed=0, jitter=0.1):
+    """
+    Returns a curve of n vertices winding inwards along a square spiral, like the zig-zag curves of
+    the test fixtures. Starting from the origin it runs right, up, left and down, every other edge
+    being one unit shorter than the previous one. Vertices are moved by up to jitter along each axis.
+    """
+    rng = np.random.RandomState(seed)
+    sides = np.repeat(np.arange(n // 2, 0, -1), 2)[-(n - 1):].astype(np.float64)
+    directions = np.array([[1.0, 0.0], [0.0, 1.0], [-1.0, 0.0], [0.0, -1.0]])[np.arange(n - 1) % 4]
+    coordinates = np.concatenate(([[0.0, 0.0]], np.cumsum(sides[:, None] * directions, axis=0)))
+    return ArrayCurve2D(coordinates + rng.uniform(-jitter, jitter, coordinates.shape))
+
+
+def road_tree(n, seed=0, step=1.0, branching=0.05, turn=0.2):
+    """
+    Returns the coordinates and parent indices of a random geometric tree of n nodes resembling a
+    road network. Roads grow from their current ends, which are picked at random, by steps of the
+    given length while slowly changing direction. With probability branching a new road instead
+    leaves a random existing node at a right angle.
+    """
+    rng = np.random.RandomState(seed)
+    coordinates = np.zeros((n, 2))
+    parents = np.full(n, -1, dtype=np.int64)
+    headings = np.zeros(n)
+
+    ends = [0]
+    branches = rng.uniform(size=n) < branching
+    turns = rng.normal(0, turn, n)
+    sides = rng.choice([-np.pi / 2, np.pi / 2], n)
+    picks = rng.uniform(size=n)
+
+    for i in range(1, n):
+        if branches[i]:
+            parent = int(picks[i] * i)
+            heading = headings[parent] + sides[i]
+            ends.append(i)
+        else:
+            k = int(picks[i] * len(ends))
+            parent = ends[k]
+            heading = headings[parent] + turns[i]
+            ends[k] = i
+
+        parents[i] = parent
+        headings[i] = heading
+        coordinates[i] = coordinates[parent] + step * np.array([np.cos(heading), np.sin(heading)])
+
+    return coordinates, parents
+
+
+def linked_tree(coordinates, parents):
+    """
+    Builds a tree of linked Tree.Node objects from the output of road_tree, children in index order.
+    """
+    return Tree.from_parent_array(coordinates, parents)
+
+
+def curve_queries(curve, m, delta, seed=0):
+    """
+    Returns m random queries against curve, as arrays accepted by CurveRangeTree2D.is_approximate_many.
+
+    Every query picks two edges i < j of the curve, points x and y inside them, and a query segment
+    whose endpoints lie within 2 * delta of x and y, so that both positive and negative answers occur.
+    """
+    rng = np.random.RandomState(seed)
+    coordinates = curve.as_array()
+    edges = len(coordinates) - 1
+
+    i = rng.randint(0, edges - 1, m)
+    j = i + 1 + (rng.uniform(size=m) * (edges - 1 - i)).astype(np.int64)
+
+    def along(k, t):
+        return (1 - t)[:, None] * coordinates[k] + t[:, None] * coordinates[k + 1]
+
+    xs = along(i, rng.uniform(0.1, 0.9, m))
+    ys = along(j, rng.uniform(0.1, 0.9, m))
+    q_edges = np.stack((xs, ys), axis=1) + rng.uniform(-2 * delta, 2 * delta, (m, 2, 2))
+    x_edges = np.stack((coordinates[i], coordinates[i + 1]), axis=1)
+    y_edges = np.stack((coordinates[j], coordinates[j + 1]), axis=1)
+
+    return q_edges, xs, ys, x_edges, y_edges
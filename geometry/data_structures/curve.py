@@ -1,6 +1,7 @@
 from __future__ import division
 
 from math import floor
+from weakref import WeakValueDictionary, ref
 
 import numpy as np
 
@@ -12,6 +13,9 @@ class PolygonalCurve2D(object):
         assert len(points) >= 2, 'Need at least 2 points to define a polygonal curve.'
         self.points = points
 
+        # Steiner curves computed so far, by spacing, for as long as they are in use
+        self.__steiner_curves = WeakValueDictionary()
+
     def __str__(self):
         point_str = '{}'.format(str(self.points[0]))
         for point in self.points[1:]:
@@ -19,7 +23,18 @@ class PolygonalCurve2D(object):
 
         return "[{}]".format(point_str)
 
+    def __getstate__(self):
+        # Steiner curves are only remembered while in use elsewhere, so they are not pickled
+        state = self.__dict__.copy()
+        del state['_PolygonalCurve2D__steiner_curves']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__steiner_curves = WeakValueDictionary()
+
     def add_point(self, point):
+        self.__steiner_curves.clear()
         return self.points.append(point)
 
     def get_point(self, i):
@@ -31,6 +46,9 @@ class PolygonalCurve2D(object):
     def size(self):
         return len(self.points)
 
+    def as_array(self):
+        return np.array([[point.x, point.y] for point in self.points], dtype=np.float64)
+
     def left_curve(self):
         median = int(floor(self.size() / 2))
         return PolygonalCurve2D(self.points[:median + 1]) if self.size() > 2 else self
@@ -57,19 +75,24 @@ class PolygonalCurve2D(object):
         return self.right_curve().contains(edge)
 
     def sub_divide(self, d_t):
-        assert d_t > 0, "Distance for line partition must be greater than 0."
-        pi = list()
-        p1 = self.points[0]
-
-        for point in self.points[1:]:
-            p2 = point
-            pi += Edge2D(p1, p2).sub_divide(d_t)
-            p1 = p2
-
-        return pi
+        """
+        Returns the (m, 2) array of the Steiner points placed d_t apart along every edge, see sub_divide_array.
+        """
+        return self.get_steiner_curve(d_t).as_array()
 
     def get_steiner_curve(self, d_t):
-        return PolygonalCurve2D(self.sub_divide(d_t))
+        """
+        Returns the curve through the Steiner points placed d_t apart along every edge. It is returned
+        again by later calls for as long as it is referenced elsewhere, so it must not be modified.
+        """
+        assert d_t > 0, "Distance for line partition must be greater than 0."
+        curve = self.__steiner_curves.get(d_t)
+        if curve is None:
+            coordinates = sub_divide_array(self.as_array(), d_t)
+            coordinates.setflags(write=False)
+            curve = self.__steiner_curves[d_t] = ArrayCurve2D(coordinates)
+
+        return curve
 
 
 class Edge2D(PolygonalCurve2D):
@@ -94,22 +117,214 @@ class Edge2D(PolygonalCurve2D):
 
         return points
 
-    def sub_divide(self, d_t):
+    def partition_range(self, d_t, x_i, delta):
+        """
+        Returns the range [start, stop) of the indices of the points within distance delta of x_i, among
+        the points sub_divide_array places along this edge for spacing d_t. Those points are evenly
+        spaced along a segment, so the range is found in O(1) time from the intersection of the edge
+        with the disk of radius delta around x_i, without visiting the points.
+        """
         assert d_t > 0, "Distance for line partition must be greater than 0."
-        pi = list()
-        pi.append(self.p1)
-        curr_t = t = d_t / self.d if self.d != 0 else 1
+        t, counts = sub_divide_steps(np.array([self.d]), d_t)
+        starts, stops = partition_ranges([self.p1.x, self.p1.y], [self.p2.x, self.p2.y], t[0], counts[0],
+                                         [[x_i.x, x_i.y]], delta)
+        return int(starts[0]), int(stops[0])
 
-        while curr_t < 1:
-            pi.append(Point2D(
-                (1 - curr_t) * self.p1.x + (curr_t * self.p2.x),
-                (1 - curr_t) * self.p1.y + (curr_t * self.p2.y)
-            ))
+    def get_steiner_edge(self, d_t):
+        return self.get_steiner_curve(d_t)
 
-            curr_t += t
 
-        pi.append(self.p2)
-        return pi
+class ArrayCurve2D(PolygonalCurve2D):
+    """
+    A polygonal curve backed by a single contiguous (n, 2) array of vertex coordinates.
 
-    def get_steiner_edge(self, d_t):
-        return PolygonalCurve2D(self.sub_divide(d_t))
+    Sub-curves share the coordinate array of the curve they were taken from and only
+    record the index range [start, stop) they cover, so splitting a curve never copies
+    vertices. Point2D objects are only created when a caller asks for them.
+
+    Sub-curves likewise share the Steiner points of the curve they were taken from. These
+    are computed once per spacing for the whole curve, the Steiner curve of a sub-curve
+    then being a view of the range of Steiner points placed along its edges. They are only
+    kept while some Steiner curve taken from them is still referenced, so holding on to the
+    Steiner curve of the whole curve keeps them shared by all of its sub-curves.
+    """
+
+    def __init__(self, coordinates, start=0, stop=None, steiner=None):
+        self.coordinates = np.ascontiguousarray(coordinates, dtype=np.float64)
+        self.start = start
+        self.stop = stop if stop is not None else len(self.coordinates)
+        assert self.stop - self.start >= 2, 'Need at least 2 points to define a polygonal curve.'
+
+        # The vertex range of the curve this one was split from and its Steiner points, by spacing
+        self.__steiner = steiner if steiner is not None else (self.start, self.stop, dict())
+
+    def __reduce__(self):
+        # Only the vertices of this sub-curve are pickled, not the whole shared array
+        return ArrayCurve2D, (self.as_array(),)
+
+    @property
+    def points(self):
+        return [Point2D(x, y) for x, y in self.as_array().tolist()]
+
+    def add_point(self, point):
+        self.coordinates = np.vstack((self.as_array(), [[point.x, point.y]]))
+        self.start = 0
+        self.stop = len(self.coordinates)
+        self.__steiner = (self.start, self.stop, dict())
+
+    def get_point(self, i):
+        if i >= self.size():
+            return None
+
+        x, y = self.as_array()[i].tolist()
+        return Point2D(x, y)
+
+    def get_spine(self):
+        return self.get_point(0), self.get_point(-1)
+
+    def size(self):
+        return self.stop - self.start
+
+    def as_array(self):
+        return self.coordinates[self.start:self.stop]
+
+    def left_curve(self):
+        median = int(floor(self.size() / 2))
+        return ArrayCurve2D(self.coordinates, self.start, self.start + median + 1, self.__steiner) \
+            if self.size() > 2 else self
+
+    def right_curve(self):
+        median = int(floor(self.size() / 2))
+        return ArrayCurve2D(self.coordinates, self.start + median, self.stop, self.__steiner) \
+            if self.size() > 2 else self
+
+    def contains(self, edge):
+        coords = self.as_array()
+        p1 = edge.get_point(0)
+        p2 = edge.get_point(1)
+
+        return bool(np.any(
+            (coords[:-1, 0] == p1.x) & (coords[:-1, 1] == p1.y) &
+            (coords[1:, 0] == p2.x) & (coords[1:, 1] == p2.y)
+        ))
+
+    def get_steiner_curve(self, d_t):
+        assert d_t > 0, "Distance for line partition must be greater than 0."
+        start, stop, curves = self.__steiner
+        coordinates, offsets = (curves[d_t][0](), curves[d_t][1]) if d_t in curves else (None, None)
+        if coordinates is None:
+            coordinates, offsets = _sub_divide(self.coordinates[start:stop], d_t)
+            coordinates.setflags(write=False)
+
+            def release(r):
+                # Drops the offsets along with the points, unless they were computed again since
+                if d_t in curves and curves[d_t][0] is r:
+                    del curves[d_t]
+
+            curves[d_t] = (ref(coordinates, release), offsets)
+
+        # The Steiner points of consecutive edges are laid out one after the other
+        return ArrayCurve2D(coordinates, offsets[self.start - start], offsets[self.stop - 1 - start])
+
+
+def sub_divide_array(coordinates, d_t):
+    """
+    Places Steiner points d_t apart along every edge of the (n, 2) array of vertices coordinates.
+    Every edge is split into pieces of length d_t and contributes both of its endpoints, the
+    points being placed at k * d_t from its start, so the result is an (m, 2) array.
+    """
+    return _sub_divide(coordinates, d_t)[0]
+
+
+def _sub_divide(coordinates, d_t):
+    # Also returns the offset of the first Steiner point of every edge, followed by the number of points
+    p1 = coordinates[:-1]
+    p2 = coordinates[1:]
+    t, counts = sub_divide_steps(np.sqrt(np.sum((p2 - p1) ** 2, axis=1)), d_t)
+
+    # Each edge contributes p1, its interior points and p2
+    sizes = counts + 2
+    offsets = np.cumsum(sizes) - sizes
+    k = np.arange(np.sum(sizes)) - np.repeat(offsets, sizes)
+    edge = np.repeat(np.arange(len(p1)), sizes)
+
+    s = np.minimum(k * t[edge], 1)
+    s[k == np.repeat(sizes - 1, sizes)] = 1
+
+    return (1 - s)[:, None] * p1[edge] + s[:, None] * p2[edge], np.append(offsets, np.sum(sizes)).tolist()
+
+
+def sub_divide_steps(lengths, d_t):
+    """
+    For edges of the given lengths, returns the parametric step t = d_t / length used to
+    sub-divide each edge along with the number of interior points k * t < 1 it receives.
+    """
+    t = np.where(lengths != 0, d_t / np.where(lengths != 0, lengths, 1), 1)
+
+    # Correct for rounding in 1 / t
+    counts = np.maximum(np.ceil(1 / t) - 1, 0).astype(np.int64)
+    counts -= (counts > 0) & (counts * t >= 1)
+    counts += (counts + 1) * t < 1
+
+    return t, counts
+
+
+def sub_divide_params(t, count, start, stop):
+    """
+    Returns the parameters along an edge of the points with indices in [start, stop) among those
+    sub_divide_array places on it, namely k * t for k = 0, ..., count followed by 1.
+    """
+    s = np.minimum(np.arange(start, stop) * t, 1)
+    if stop == count + 2 and stop > start:
+        s[-1] = 1
+
+    return s
+
+
+def partition_ranges(p1, p2, t, count, centers, r):
+    """
+    For the points p1 + s_k * (p2 - p1) with s_k = k * t for k = 0, ..., count followed by s_k = 1, as
+    sub_divide_array places them along an edge, returns two arrays holding for every row of the (m, 2)
+    array centers the range [start, stop) of the indices k of the points within distance r of it.
+
+    The points within distance r of a center are those whose parameter falls in the interval cut out
+    of the edge by the disk of radius r around it, so each range is computed in O(1) time. Its bounds
+    are then checked against the points next to them, so that the ranges agree exactly with a
+    comparison of every point's distance to r despite rounding.
+
+    Several edges are handled at once by giving p1, p2, t and count leading dimensions, which are
+    broadcast against those of centers, e.g. (n, 1, 2) endpoints against (1, m, 2) centers.
+    """
+    p1 = np.asarray(p1, dtype=np.float64)
+    p2 = np.asarray(p2, dtype=np.float64)
+    centers = np.asarray(centers, dtype=np.float64)
+    centers = centers.reshape(-1, 2) if centers.ndim < 2 else centers
+    d = p2 - p1
+    length2 = np.sum(d ** 2, axis=-1)
+    length2 = np.where(length2 > 0, length2, 1.0)
+
+    # Projection of every center onto the line through the edge, and half the chord cut by its disk
+    offsets = centers - p1
+    t0 = np.sum(offsets * d, axis=-1) / length2
+    h2 = np.maximum(np.sum(offsets ** 2, axis=-1) - t0 ** 2 * length2, 0)
+    w = np.sqrt(np.maximum(r ** 2 - h2, 0) / length2)
+
+    last = count + 2
+    starts = np.clip(np.ceil((t0 - w) / t), 0, last).astype(np.int64)
+    stops = np.clip(np.floor((t0 + w) / t) + 1, 0, count + 1).astype(np.int64)
+    stops = np.where(t0 + w >= 1, last, stops)
+    stops = np.maximum(stops, starts)
+
+    def within(k):
+        k = np.clip(k, 0, last - 1)
+        s = np.where(k == last - 1, 1, np.minimum(k * t, 1))
+        points = (1 - s)[..., None] * p1 + s[..., None] * p2
+        return np.hypot(points[..., 0] - centers[..., 0], points[..., 1] - centers[..., 1]) <= r
+
+    # Move each bound by one point where rounding placed it on the wrong side of the disk boundary
+    starts -= (starts > 0) & within(starts - 1)
+    starts += (starts < stops) & ~within(starts)
+    stops += (stops < last) & within(stops)
+    stops -= (stops > starts) & ~within(stops - 1)
+
+    return starts, stops
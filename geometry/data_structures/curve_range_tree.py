@@ -1,7 +1,18 @@
-from geometry.data_structures.curve import Edge2D
-from geometry.data_structures.frechet_grid import FrechetGrid2D
-from geometry.data_structures.graph import DirectedAcyclicGraph
+from math import floor
+from multiprocessing import Pool
+from timeit import default_timer
+
+import numpy as np
+
+from geometry import STEINER_SPACING
+from geometry.data_structures.curve import ArrayCurve2D, Edge2D, PolygonalCurve2D, partition_ranges, \
+    sub_divide_params, sub_divide_steps
+from geometry.data_structures.frechet_grid import FrechetGrid2D, SegmentFrechetGrid2D
+from geometry.data_structures.graph import LayeredGraph
+from geometry.data_structures.point import Point2D
 from geometry.data_structures.tree import Tree
+from geometry.utils import instrumentation
+from geometry.utils.storage import read_arrays, write_arrays
 
 
 class CurveRangeTree2D(Tree):
@@ -17,24 +28,75 @@ class CurveRangeTree2D(Tree):
     x to y.
 
     Note that construction of the data structure takes O((1 / error ** 4) * log ** 2 (n / error) * log ** 2 (n)) time.
+
+    The engine used to pre-compute the Frechet Grids is selected by engine, see FrechetGrid2D.
+    The grid of each node only depends on the node's subpath, so passing workers > 1 builds the
+    grids in a pool of that many processes, the tree being assembled as their tables come back.
+    An existing multiprocessing pool may be passed as pool instead, to share it between trees. The
+    resulting tree is identical to the one built serially. Passing lazy=True instead defers building
+    the grids until queries first reach them, see FrechetGrid2D.
+
+    A built tree can be written to disk with save and restored with load, which memory-maps the
+    stored distance tables instead of pre-computing them again.
+
+    Queries report the time spent in each of their stages, along with the work done, to the
+    QueryStats of geometry.utils.instrumentation while instrumentation is enabled.
+
+    Every node records the index range [start, stop) of its subpath along the curve stored at the
+    root, and edge i of the curve, from vertex i to vertex i + 1, is indexed by its coordinates. The
+    leaf holding an edge is thus found in O(1) time and descending towards it only compares integers.
+    The edges at x and y, only partially covered by P[x, y], are matched against Q with the closed form
+    of the Frechet distance between two segments, see SegmentFrechetGrid2D.
+
+    Every node also records the spine and bounding box of its subpath. Along with the distance from
+    its spine to the subpath, computed with its grid, these bound the Frechet distance from Q to P[x, y]
+    so that queries far from or close to P[x, y] are resolved without looking up the grids, see prefilter.
     """
 
-    def __init__(self, curve, error, delta):
+    def __init__(self, curve, error, delta, engine='discrete', workers=1, lazy=False, pool=None):
         self.__error = error
         self.__delta = delta
-        super(CurveRangeTree2D, self).__init__(self.__build_tree(curve))
-        self.decompose()
+        self.__engine = engine
+        self.__lazy = lazy
+        self.__edges = _edge_index(curve.as_array())
+        self.__leaves = [None] * (curve.size() - 1)
+
+        # A pool of our own is only kept for the duration of the build
+        own_pool = Pool(workers) if pool is None and workers > 1 and not lazy else None
+        pool = pool if pool is not None else own_pool
+        try:
+            grids = self.__build_grids(curve, pool) if pool is not None and not lazy else None
+
+            # Sub-curves of an ArrayCurve2D share its Steiner points for as long as they are held, which
+            # is only needed while the grids are built
+            steiner = curve.get_steiner_curve(STEINER_SPACING) \
+                if isinstance(curve, ArrayCurve2D) and engine == 'discrete' and not lazy and grids is None else None
+            super(CurveRangeTree2D, self).__init__(self.__build_tree(curve, grids=grids))
+            del steiner
+        finally:
+            if own_pool is not None:
+                own_pool.close()
+                own_pool.join()
+
+        self.decompose(lca_index=True)
 
     class Node(object):
-        def __init__(self, curve, error, parent=None):
+        def __init__(self, curve, error, parent=None, engine='discrete', grid=None, lazy=False, start=None):
             self.parent = parent
             self.curve = curve
+            self.start = start
+            self.stop = start + curve.size() if start is not None else None
             self.left = None
             self.right = None
-            self.grid = FrechetGrid2D(curve, error)
+            self.grid = grid if grid is not None else FrechetGrid2D(curve, error, engine=engine, lazy=lazy)
             self.gpar = None
             self.point = None
 
+            # Endpoints and bounding box of the subpath, used to resolve queries without looking up the grid
+            coordinates = curve.as_array()
+            self.spine = coordinates[[0, -1]]
+            self.box = np.array([coordinates.min(axis=0), coordinates.max(axis=0)])
+
         def is_leaf(self):
             return True if not (self.left or self.right) else False
 
@@ -60,144 +122,648 @@ class CurveRangeTree2D(Tree):
             return
             yield
 
+    def save(self, path):
+        metadata, arrays = self.to_arrays()
+        write_arrays(path, arrays, metadata)
+
+    @staticmethod
+    def load(path, mmap=True):
+        metadata, arrays = read_arrays(path, mmap)
+        return CurveRangeTree2D.from_arrays(metadata, arrays)
+
+    def to_arrays(self, prefix=''):
+        """
+        Flattens the tree into plain arrays, named with the given prefix, along with the metadata
+        needed by from_arrays. Nodes are listed in pre-order, each one storing the index range of
+        its subpath along the curve stored at the root.
+        """
+        ranges = list()
+        children = list()
+        spine_distances = list()
+        tables = list()
+
+        stack = [(self.root, 0, self.root.curve.size(), -1, 0)]
+        while len(stack) > 0:
+            node, start, stop, parent, side = stack.pop()
+            index = len(ranges)
+
+            if parent >= 0:
+                children[parent][side] = index
+
+            ranges.append((start, stop))
+            children.append([-1, -1])
+            spine_distances.append(node.grid.spine_distance)
+            table = node.grid.table()
+            tables.append(table if table is not None else np.empty((0, 0)))
+
+            if not node.is_leaf():
+                median = int(floor((stop - start) / 2))
+                stack.append((node.right, start + median, stop, index, 1))
+                stack.append((node.left, start, start + median + 1, index, 0))
+
+        shapes = np.array([table.shape for table in tables], dtype=np.int64)
+        sizes = shapes[:, 0] * shapes[:, 1]
+
+        metadata = {
+            'error': self.__error,
+            'delta': self.__delta,
+            'engine': self.__engine,
+            'curve': 'array' if isinstance(self.root.curve, ArrayCurve2D) else 'polygonal'
+        }
+
+        arrays = {
+            prefix + 'coordinates': self.root.curve.as_array(),
+            prefix + 'ranges': np.array(ranges, dtype=np.int64),
+            prefix + 'children': np.array(children, dtype=np.int64),
+            prefix + 'spine_distances': np.array(spine_distances, dtype=np.float64),
+            prefix + 'table_shapes': shapes,
+            prefix + 'table_offsets': np.cumsum(sizes) - sizes,
+            prefix + 'tables': np.concatenate([table.ravel() for table in tables])
+        }
+
+        return metadata, arrays
+
+    @staticmethod
+    def from_arrays(metadata, arrays, prefix=''):
+        tree = CurveRangeTree2D.__new__(CurveRangeTree2D)
+        tree.__error = metadata['error']
+        tree.__delta = metadata['delta']
+        tree.__engine = metadata['engine']
+        tree.__lazy = False
+
+        coordinates = arrays[prefix + 'coordinates']
+        tree.__edges = _edge_index(coordinates)
+        tree.__leaves = [None] * (len(coordinates) - 1)
+
+        if metadata['curve'] == 'array':
+            def sub_curve(start, stop):
+                return ArrayCurve2D(coordinates, start, stop)
+        else:
+            points = [Point2D(x, y) for x, y in coordinates.tolist()]
+
+            def sub_curve(start, stop):
+                return PolygonalCurve2D(points[start:stop])
+
+        ranges = arrays[prefix + 'ranges'].tolist()
+        children = arrays[prefix + 'children'].tolist()
+        spine_distances = arrays[prefix + 'spine_distances'].tolist()
+        shapes = arrays[prefix + 'table_shapes'].tolist()
+        offsets = arrays[prefix + 'table_offsets'].tolist()
+        tables = arrays[prefix + 'tables']
+
+        nodes = list()
+        for i in range(0, len(ranges)):
+            curve = sub_curve(*ranges[i])
+            rows, cols = shapes[i]
+            distances = tables[offsets[i]:offsets[i] + rows * cols].reshape(rows, cols) \
+                if spine_distances[i] != 0 else None
+            grid = FrechetGrid2D(curve, tree.__error, engine=tree.__engine,
+                                 spine_distance=spine_distances[i], distances=distances)
+
+            nodes.append(tree.Node(curve, tree.__error, engine=tree.__engine, grid=grid, start=ranges[i][0]))
+
+        for node, (left, right) in zip(nodes, children):
+            if left < 0 and right < 0:
+                tree.__leaves[node.start] = node
+            if left >= 0:
+                node.left = nodes[left]
+                node.left.parent = node
+            if right >= 0:
+                node.right = nodes[right]
+                node.right.parent = node
+
+        super(CurveRangeTree2D, tree).__init__(nodes[0])
+        tree.decompose(lca_index=True)
+        return tree
+
+    @instrumentation.query
     def is_approximate(self, q_edge, x, y, x_edge, y_edge):
         # Step 1: Partition path in O(log n) subpaths
         subpaths = self.partition_path(x, y, x_edge, y_edge)
 
-        # Refactored for reusability
+        return self.decide(q_edge, subpaths)
+
+    @instrumentation.query
+    def is_approximate_many(self, q_edges, xs, ys, x_edges, y_edges):
+        """
+        Answers a batch of is_approximate queries, returning a boolean array with one answer per query.
+
+        Segments are given as (m, 2, 2) arrays holding the coordinates of both endpoints of each segment,
+        and the points x and y as (m, 2) arrays. Queries are grouped by (x_edge, y_edge) so that the path
+        is only partitioned once per group. The DAGs of all queries are then swept together one layer at a
+        time, weighing the edges out of that layer with one lookup per grid, see __find_frechet_bottlenecks.
+        """
+        q_edges = np.asarray(q_edges, dtype=np.float64).reshape(-1, 2, 2)
+        xs = np.asarray(xs, dtype=np.float64).reshape(-1, 2)
+        ys = np.asarray(ys, dtype=np.float64).reshape(-1, 2)
+        keys = np.concatenate((
+            np.asarray(x_edges, dtype=np.float64).reshape(-1, 4),
+            np.asarray(y_edges, dtype=np.float64).reshape(-1, 4)
+        ), axis=1).tolist()
+
+        groups = dict()
+        owners = np.array([groups.setdefault(tuple(key), len(groups)) for key in keys], dtype=np.int64)
+
+        paths = list()
+        for key in groups:
+            subpaths, _, _ = self.__partition_leaves(self.__find_leaf(key[:4]), self.__find_leaf(key[4:]))
+            assert len(subpaths) > 0, 'x and y must lie on distinct edges.'
+            paths.append(subpaths)
+
+        return self.__find_frechet_bottlenecks(q_edges[:, 0], q_edges[:, 1], xs, ys, paths, owners)
+
+    def decide(self, q_edge, subpaths):
+        """
+        Decides the query of q_edge against the path covered by subpaths, see partition_path, which is
+        only handed to find_frechet_bottleneck when the prefilter cannot resolve it.
+        """
+        stats = instrumentation.STATS
+        if stats is not None:
+            stats.count('queries')
+
+        answer = self.prefilter(q_edge, subpaths)
+        if answer is not None:
+            return answer
+
         return self.find_frechet_bottleneck(q_edge, subpaths)
 
-    def find_frechet_bottleneck(self, q_edge, subpaths):
-        # Step 2: Partition q_edge and compute partitioning point sets
-        partitions = list()
-        pi = q_edge.sub_divide(self.__error * self.__delta / 3)
-        for subpath in subpaths[1:]:
-            dag_points = Edge2D.partition(
-                pi,
-                subpath.curve.get_point(0),
-                2 * self.__delta
+    def prefilter(self, q_edge, subpaths):
+        """
+        Resolves a query from bounds on the Frechet distance between q_edge and the path covered by
+        subpaths, returning False when it exceeds (1 + error) * delta, True when it is at most delta,
+        and None when the grids are needed to answer the query. Either answer is one is_approximate
+        may give, although the DAG of find_frechet_bottleneck, weighed with the estimates of the grids,
+        may give the other one. These checks take O(log n) time.
+
+        The distance is at least that from the ends of q_edge to x and y, at which the path starts and
+        ends, and that from q_edge to any vertex or to the sides of the bounding box of any subpath. It is
+        at most the distance from q_edge to the polyline through the spines of the subpaths, matched point
+        by point in proportion to its length, plus the largest distance from a spine to its subpath.
+        """
+        stats = instrumentation.STATS
+        if stats is not None:
+            start = default_timer()
+
+        p1 = np.array([[q_edge.p1.x, q_edge.p1.y]])
+        p2 = np.array([[q_edge.p2.x, q_edge.p2.y]])
+
+        answer = None
+        if len(subpaths) > 0:
+            inner = subpaths[1:-1]
+            reject, accept = self.__bounds(
+                p1, p2, subpaths[0].spine[[0]], subpaths[-1].spine[[1]],
+                np.array([node.spine[0] for node in subpaths[1:]]).reshape(-1, 2),
+                np.zeros(len(subpaths) - 1, dtype=np.int64),
+                np.array([node.box for node in inner]).reshape(-1, 2, 2),
+                np.zeros(len(inner), dtype=np.int64),
+                np.array([max([node.grid.spine_distance for node in inner] + [0.0])])
             )
+            answer = False if reject[0] else True if accept[0] else None
+
+        if stats is not None:
+            stats.lap('prefilter', start)
+            if answer is not None:
+                stats.count('prefiltered')
+                stats.count('prefilter_rejections' if not answer else 'prefilter_acceptances')
+
+        return answer
+
+    def __bounds(self, p1, p2, xs, ys, vertices, owners, boxes, box_owners, spine_distances):
+        # For the segments from the rows of p1 to those of p2, whether they are sure to be rejected and whether
+        # they are sure to be accepted. The path of each segment runs from its row of xs through the rows of
+        # vertices of that segment in owners to its row of ys. The boxes of the subpaths between those vertices
+        # are given as (2, 2) arrays of their lower and upper corners, along with their segment in box_owners,
+        # and spine_distances holds the largest distance from one of their spines to its subpath
+        m = len(p1)
+        lower = np.maximum(np.hypot(p1[:, 0] - xs[:, 0], p1[:, 1] - xs[:, 1]),
+                           np.hypot(p2[:, 0] - ys[:, 0], p2[:, 1] - ys[:, 1]))
+        np.maximum.at(lower, owners, _segment_distances(vertices, p1[owners], p2[owners]))
+
+        # Every box has a point of the path on each of its sides
+        gaps = np.maximum(boxes[:, 1] - np.maximum(p1, p2)[box_owners], np.minimum(p1, p2)[box_owners] - boxes[:, 0])
+        np.maximum.at(lower, box_owners, np.max(gaps, axis=1))
+
+        # The polyline through xs, vertices and ys, with the fraction of its length at every point
+        counts = np.bincount(owners, minlength=m) + 2
+        firsts = np.cumsum(counts) - counts
+        points = np.empty((np.sum(counts), 2))
+        points[firsts] = xs
+        points[firsts + counts - 1] = ys
+        points[np.repeat(firsts + 1, counts - 2) + _ragged_arange(counts - 2)] = vertices
+
+        steps = np.concatenate(([0.0], np.hypot(*np.diff(points, axis=0).T)))
+        steps[firsts] = 0
+        lengths = np.cumsum(steps)
+        lengths -= np.repeat(lengths[firsts], counts)
+        totals = np.repeat(lengths[firsts + counts - 1], counts)
+        t = (lengths / np.where(totals > 0, totals, 1))[:, None]
+
+        point_owners = np.repeat(np.arange(m), counts)
+        matched = (1 - t) * p1[point_owners] + t * p2[point_owners] - points
+        upper = np.zeros(m)
+        np.maximum.at(upper, point_owners, np.hypot(matched[:, 0], matched[:, 1]))
+
+        reject = lower > (1 + self.__error) * self.__delta
+        return reject, ~reject & (upper + spine_distances <= self.__delta)
 
-            if len(dag_points) > 0:
-                partitions.append(dag_points)
-
-        # Step 3: Construct the Directed Acyclic Graph
-        dag = DirectedAcyclicGraph()
-        for i in range(0, len(partitions) - 1):
-            j = i + 1
-
-            for u in partitions[i]:
-                for v in partitions[j]:
-                    if u == v:
-                        continue
-                    elif u != q_edge.p2 and v.is_on_edge(Edge2D(u, q_edge.p2)):
-                        dag.add_edge(u, v, subpaths[i + 1].grid.approximate_frechet(Edge2D(u, v)))
-
-        if len(partitions) > 0:
-            for v in partitions[0]:
-                if v == q_edge.p1:
-                    continue
-                dag.add_edge(q_edge.p1, v, subpaths[0].grid.approximate_frechet(Edge2D(q_edge.p1, v)))
-
-            for u in partitions[len(partitions) - 1]:
-                if u == q_edge.p2:
-                    continue
-                dag.add_edge(u, q_edge.p2, subpaths[len(partitions) - 1].grid.approximate_frechet(Edge2D(u, q_edge.p2)))
-        else:
-            dag.add_edge(q_edge.p1, q_edge.p2, subpaths[0].grid.approximate_frechet(Edge2D(q_edge.p1, q_edge.p2)))
-            dag.add_edge(q_edge.p1, q_edge.p2,
-                         subpaths[len(partitions) - 1].grid.approximate_frechet(Edge2D(q_edge.p1, q_edge.p2)))
+    def find_frechet_bottleneck(self, q_edge, subpaths):
+        """
+        Decides whether the bottleneck path through the layered DAG of q_edge and subpaths weighs at
+        most (1 + error) * delta, without computing its weight.
+
+        The DAG is swept one layer at a time, only keeping the vertices of the next layer that can be
+        reached by an edge of weight at most (1 + error) * delta. Edges are only weighed from reached
+        vertices, and the query is rejected as soon as a layer cannot be reached.
+        """
+        stats = instrumentation.STATS
+        if stats is not None:
+            start = default_timer()
+            stats.count('subpaths', len(subpaths))
+
+        # Steps 2 and 3: Partition q_edge and sweep the layered DAG, keeping the light edges only
+        layers, grids, along = self.__layers(q_edge, subpaths)
+        threshold = (1 + self.__error) * self.__delta
+
+        if stats is not None:
+            start = stats.lap('partition', start)
+
+        reached = np.ones(1, dtype=bool)
+        for k in range(0, len(layers) - 1):
+            sources = np.flatnonzero(reached)
+            rows, targets = np.nonzero(layers[k][sources, None] < layers[k + 1][None, :])
+            sources = sources[rows]
+
+            light = grids[k].approximate_frechet_many(
+                along(layers[k][sources]),
+                along(layers[k + 1][targets])
+            ) <= threshold
+            reached = np.zeros(len(layers[k + 1]), dtype=bool)
+            reached[targets[light]] = True
+
+            if stats is not None:
+                stats.count('dag_vertices', len(np.unique(sources)))
+                stats.count('dag_edges', int(np.count_nonzero(light)))
+
+            if not np.any(reached):
+                if stats is not None:
+                    stats.count('skipped_layers', len(layers) - 2 - k)
+                    stats.lap('dag', start)
+                return False
+
+        if stats is not None:
+            stats.count('dag_vertices', 1)
+            stats.lap('dag', start)
+
+        return True
+
+    def frechet_bottleneck_weight(self, q_edge, subpaths):
+        """
+        Returns the weight of the bottleneck path through the layered DAG of q_edge and subpaths, of
+        which find_frechet_bottleneck only decides whether it is at most (1 + error) * delta.
+        """
+        stats = instrumentation.STATS
+        if stats is not None:
+            start = default_timer()
+
+        # Steps 2 and 3: Partition q_edge and construct the layered DAG
+        layers, grids, along = self.__layers(q_edge, subpaths)
+        dag = LayeredGraph([len(layer) for layer in layers])
+
+        if stats is not None:
+            start = stats.lap('partition', start)
+
+        for k in range(0, len(layers) - 1):
+            # Paths along q_edge are monotone, so u can only be followed by the points v strictly after it.
+            # This also leaves out the edges from q_edge.p1 to itself and from q_edge.p2 to itself.
+            sources, targets = np.nonzero(layers[k][:, None] < layers[k + 1][None, :])
+            if len(sources) == 0:
+                continue
+
+            # Weights of all edges between consecutive layers are looked up in one batch
+            dag.add_edges(k, sources, targets, grids[k].approximate_frechet_many(
+                along(layers[k][sources]),
+                along(layers[k + 1][targets])
+            ))
+
+        if stats is not None:
+            start = stats.lap('dag', start)
 
         # Step 4: Find the heaviest weighted edge on the bottleneck path of the DAG
-        delta_prime = dag.bottleneck_path_weight(q_edge.p1, q_edge.p2)
-        return delta_prime <= (1 + self.__error) * self.__delta
+        delta_prime = dag.bottleneck_path_weight()
+
+        if stats is not None:
+            stats.lap('bottleneck', start)
+
+        return delta_prime
+
+    def __find_frechet_bottlenecks(self, p1, p2, xs, ys, paths, groups):
+        """
+        Decides find_frechet_bottleneck for the segments from the rows of p1 to those of p2. Query k runs
+        against the nodes paths[groups[k]] returned by __partition_leaves, with their first and last
+        subpaths cut at xs[k] and ys[k]. Each query is first checked as in prefilter.
+
+        The layers of all queries are stored in one flat array of parameters, block by block: the first
+        block of a query holds q_edge.p1, the next ones its partitions and the last one q_edge.p2. The
+        DAGs are then swept together, so the k-th edges of all queries are weighed at once, with one
+        lookup per grid. The partial subpaths at x and y differ between queries and are weighed in
+        closed form instead.
+        """
+        stats = instrumentation.STATS
+        if stats is not None:
+            start = default_timer()
+            stats.count('queries', len(p1))
+
+        threshold = (1 + self.__error) * self.__delta
+        answers = np.zeros(len(p1), dtype=bool)
+
+        # Start of every subpath but the first and box of every subpath but the first and last, path by path,
+        # the largest spine distance of those subpaths per path, and an index of the grids of the nodes
+        sizes = np.array([len(path) for path in paths], dtype=np.int64)
+        vertices = np.array([node.spine[0] for path in paths for node in path[1:]]).reshape(-1, 2)
+        boxes = np.array([node.box for path in paths for node in path[1:-1]]).reshape(-1, 2, 2)
+        spine_distances = np.array([
+            max([node.grid.spine_distance for node in path[1:-1]] + [0.0]) for path in paths
+        ])
+        x_stops = np.array([path[0].spine[1] for path in paths]).reshape(-1, 2)
+        y_starts = np.array([path[-1].spine[0] for path in paths]).reshape(-1, 2)
+        nodes = dict()
+        node_ids = np.array([nodes.setdefault(node, len(nodes)) for path in paths for node in path], dtype=np.int64)
+        grids = [node.grid for node in nodes]
+        node_offsets = np.cumsum(sizes) - sizes
+
+        def rows(groups, skipped=1):
+            # Rows of the queries of the given groups in arrays holding all but skipped items per path, as
+            # vertices and boxes do, along with their query
+            counts = sizes[groups] - skipped
+            return np.repeat(node_offsets[groups] - skipped * groups, counts) + _ragged_arange(counts), \
+                np.repeat(np.arange(len(groups)), counts)
+
+        vertex, owner = rows(groups)
+        box, box_owner = rows(groups, 2)
+        reject, accept = self.__bounds(p1, p2, xs, ys, vertices[vertex], owner, boxes[box], box_owner,
+                                       spine_distances[groups])
+        answers[accept] = True
+        queries = np.flatnonzero(~(reject | accept))
+
+        if stats is not None:
+            # One prefilter call per query, as is_approximate makes
+            start = stats.lap('prefilter', start, len(p1))
+            stats.count('prefiltered', len(p1) - len(queries))
+            stats.count('prefilter_rejections', int(np.count_nonzero(reject)))
+            stats.count('prefilter_acceptances', int(np.count_nonzero(accept)))
+            stats.count('subpaths', int(np.sum(sizes[groups[queries]])))
+
+        if len(queries) == 0:
+            return answers
+
+        p1, p2, xs, ys, groups = p1[queries], p2[queries], xs[queries], ys[queries], groups[queries]
+        m = len(queries)
+        lengths = sizes[groups]
+        vertex, owner = rows(groups)
+
+        steps, counts = self.__steps(p1, p2)
+        starts, stops = partition_ranges(p1[owner], p2[owner], steps[owner], counts[owner], vertices[vertex],
+                                         2 * self.__delta)
+
+        # Every query has lengths + 1 blocks of parameters, those of its partitions in between its endpoints
+        first_blocks = np.cumsum(lengths + 1) - (lengths + 1)
+        partitions = np.repeat(first_blocks + 1, lengths - 1) + _ragged_arange(lengths - 1)
+        block_sizes = np.ones(np.sum(lengths + 1), dtype=np.int64)
+        block_sizes[partitions] = stops - starts
+        block_offsets = np.cumsum(block_sizes) - block_sizes
+        block_owners = np.repeat(np.arange(m), lengths + 1)
+
+        def params(blocks):
+            # Positions of the parameters of the given blocks
+            return np.repeat(block_offsets[blocks], block_sizes[blocks]) + _ragged_arange(block_sizes[blocks])
+
+        layers = np.ones(np.sum(block_sizes))
+        layers[block_offsets[first_blocks]] = 0
+        index = np.repeat(starts, stops - starts) + _ragged_arange(stops - starts)
+        owner = np.repeat(owner, stops - starts)
+        layers[params(partitions)] = np.where(index == counts[owner] + 1, 1, np.minimum(index * steps[owner], 1))
+        owners = np.repeat(block_owners, block_sizes)
+
+        if stats is not None:
+            start = stats.lap('partition', start)
+
+        reached = np.zeros(len(layers), dtype=bool)
+        reached[block_offsets[first_blocks]] = True
+        for k in range(0, np.max(lengths)):
+            # Every reached vertex of layer k is paired with the vertices of layer k + 1 of its query
+            sources = params(first_blocks[lengths > k] + k)
+            sources = sources[reached[sources]]
+            if len(sources) == 0:
+                break
+
+            targets = first_blocks[owners[sources]] + k + 1
+            repeats = block_sizes[targets]
+            targets = np.repeat(block_offsets[targets], repeats) + _ragged_arange(repeats)
+            sources = np.repeat(sources, repeats)
+
+            forward = layers[sources] < layers[targets]
+            sources, targets = sources[forward], targets[forward]
+            owner = owners[sources]
+
+            a = (1 - layers[sources])[:, None] * p1[owner] + layers[sources][:, None] * p2[owner]
+            b = (1 - layers[targets])[:, None] * p1[owner] + layers[targets][:, None] * p2[owner]
+            if k == 0:
+                weights = SegmentFrechetGrid2D.frechet_many(a, b, xs[owner], x_stops[groups[owner]])
+            else:
+                weights = np.empty(len(sources))
+                last = lengths[owner] == k + 1
+                weights[last] = SegmentFrechetGrid2D.frechet_many(
+                    a[last], b[last], y_starts[groups[owner[last]]], ys[owner[last]])
+
+                inner = np.flatnonzero(~last)
+                ids = node_ids[node_offsets[groups[owner[inner]]] + k]
+                for node in np.unique(ids).tolist():
+                    pairs = inner[ids == node]
+                    weights[pairs] = grids[node].approximate_frechet_many(a[pairs], b[pairs])
+
+            light = weights <= threshold
+            reached[targets[light]] = True
+
+            if stats is not None:
+                stats.count('dag_vertices', len(np.unique(sources)))
+                stats.count('dag_edges', int(np.count_nonzero(light)))
+
+        answers[queries] = reached[block_offsets[first_blocks + lengths]]
+
+        if stats is not None:
+            stats.lap('dag', start)
+
+        return answers
+
+    def __layers(self, q_edge, subpaths):
+        """
+        Partitions q_edge and returns the layers of its DAG, as sorted parameters along q_edge with
+        q_edge.p1 and q_edge.p2 alone in the first and last layers, matched with x and y. Also returns
+        the grids weighing the edges out of every layer, and a function mapping parameters to points of
+        q_edge.
+        """
+        # The points of q_edge near each subpath form one contiguous range, found without visiting them
+        p1 = np.array([q_edge.p1.x, q_edge.p1.y])
+        p2 = np.array([q_edge.p2.x, q_edge.p2.y])
+        step, count = self.__steps(p1[None, :], p2[None, :])
+        step, count = step[0], count[0]
+
+        def along(t):
+            return (1 - t)[:, None] * p1 + t[:, None] * p2
+
+        vertices = _coordinates([subpath.curve.get_point(0) for subpath in subpaths[1:]])
+        starts, stops = partition_ranges(p1, p2, step, count, vertices, 2 * self.__delta)
+
+        # Layer k + 1 holds the points of q_edge near the start of subpath k + 1, so the edges out of layer k
+        # are weighed with the grid of subpath k. An empty layer disconnects q_edge.p1 from q_edge.p2.
+        partitions = [sub_divide_params(step, count, a, b) for a, b in zip(starts.tolist(), stops.tolist())]
+        layers = [np.zeros(1)] + partitions + [np.ones(1)]
+        grids = [subpath.grid for subpath in subpaths]
+
+        return layers, grids, along
+
+    def __steps(self, p1, p2):
+        # Parametric steps placing points error * delta / 3 apart along the segments from p1 to p2
+        return sub_divide_steps(np.sqrt(np.sum((p2 - p1) ** 2, axis=-1)), self.__error * self.__delta / 3)
 
-    # noinspection PyUnreachableCode
     def partition_path(self, x, y, x_edge, y_edge):
-        # Assumes x located on the left side of the path w.r.t. y
-        x_node = self.__find_node(self.root, x_edge)
-        y_node = self.__find_node(self.root, y_edge)
+        subpaths, x_node, y_node = self.__partition_edges(x_edge, y_edge)
+        return [
+            self.__start_subpath(x, node) if node == x_node else
+            self.__end_subpath(node, y) if node == y_node else node
+            for node in subpaths
+        ]
+
+    def __partition_edges(self, x_edge, y_edge):
+        return self.__partition_leaves(self.__find_node(x_edge), self.__find_node(y_edge))
+
+    def __partition_leaves(self, x_node, y_node):
+        stats = instrumentation.STATS
+        if stats is not None:
+            start = default_timer()
 
+        # Assumes x located on the left side of the path w.r.t. y
         # Assumes tree has already been decomposed
         lca = self.lowest_common_ancestor(x_node, y_node)
 
-        # noinspection PyUnreachableCode
-        def __walk_left(node, edge):
-            if node.is_leaf():
-                yield node
-            elif node.curve.is_in_left_curve(edge):
-                for n in __walk_left(node.left, edge):
-                    yield n
-
-                yield node.right
-            elif node.curve.is_in_right_curve(edge):
-                for n in __walk_left(node.right, edge):
-                    yield n
-            else:
-                return
-                yield
-
-        # noinspection PyUnreachableCode
-        def __walk_right(node, edge):
-            if node.is_leaf():
-                yield node
-            elif node.curve.is_in_left_curve(edge):
-                for n in __walk_right(node.left, edge):
-                    yield n
-            elif node.curve.is_in_right_curve(edge):
-                for n in __walk_right(node.right, edge):
-                    yield n
-
-                yield node.left
-            else:
-                return
-                yield
+        def __walk_left(node, i):
+            # Whenever the walk goes left, the right sibling is entirely covered by P[x, y]
+            siblings = list()
+            while not node.is_leaf():
+                if i < node.left.stop - 1:
+                    siblings.append(node.right)
+                    node = node.left
+                else:
+                    node = node.right
+
+            return [node] + siblings[::-1]
+
+        def __walk_right(node, i):
+            siblings = list()
+            while not node.is_leaf():
+                if i >= node.right.start:
+                    siblings.append(node.left)
+                    node = node.right
+                else:
+                    node = node.left
+
+            return [node] + siblings[::-1]
 
         subpaths = list()
 
         if lca.left:
-            for node in __walk_left(lca.left, x_edge):
-                if node == x_node:
-                    node = self.Node(
-                        Edge2D(x, node.curve.get_point(1)),
-                        self.__error
-                    )
-
-                subpaths.append(node)
+            subpaths += __walk_left(lca.left, x_node.start)
 
         if lca.right:
-            right_subpaths = list()
+            subpaths += __walk_right(lca.right, y_node.start)[::-1]
+
+        if stats is not None:
+            stats.lap('partition_path', start)
 
-            for node in __walk_right(lca.right, y_edge):
-                if node == y_node:
-                    node = self.Node(
-                        Edge2D(node.curve.get_point(0), y),
-                        self.__error
-                    )
+        # The leaves at x_node and y_node are only partially covered by P[x, y]
+        return subpaths, x_node, y_node
 
-                right_subpaths.append(node)
+    def __start_subpath(self, x, node):
+        return self.__partial_subpath(Edge2D(x, node.curve.get_point(1)))
 
-            subpaths += right_subpaths[::-1]
+    def __end_subpath(self, node, y):
+        return self.__partial_subpath(Edge2D(node.curve.get_point(0), y))
 
-        return subpaths
+    def __partial_subpath(self, edge):
+        # The Frechet distance to a single segment has a closed form, so no grid is built at query time
+        return self.Node(edge, self.__error, grid=SegmentFrechetGrid2D(edge))
 
-    def __build_tree(self, curve, parent=None):
+    def __build_tree(self, curve, parent=None, grids=None, start=0):
         # Note: Not passing error / 2 for performance reasons
-        node = self.Node(curve, self.__error, parent)
+        grid = next(grids) if grids is not None else None
+        node = self.Node(curve, self.__error, parent, self.__engine, grid, self.__lazy, start)
 
         if curve.size() == 2:
+            self.__leaves[start] = node
             return node
 
-        node.left = self.__build_tree(curve.left_curve(), node)
-        node.right = self.__build_tree(curve.right_curve(), node)
+        median = int(floor(curve.size() / 2))
+        node.left = self.__build_tree(curve.left_curve(), node, grids, start)
+        node.right = self.__build_tree(curve.right_curve(), node, grids, start + median)
         return node
 
-    def __find_node(self, node, edge):
-        if node.is_leaf():
-            return node
-        elif node.curve.is_in_left_curve(edge):
-            return self.__find_node(node.left, edge)
-        elif node.curve.is_in_right_curve(edge):
-            return self.__find_node(node.right, edge)
-        else:
-            return None
\ No newline at end of file
+    def __build_grids(self, curve, pool):
+        # Subpaths are visited in the same pre-order as __build_tree
+        curves = list()
+        stack = [curve]
+        while len(stack) > 0:
+            c = stack.pop()
+            curves.append(c)
+
+            if c.size() > 2:
+                stack.append(c.right_curve())
+                stack.append(c.left_curve())
+
+        # Tables are handed to __build_tree in order as they come back, while the workers carry on
+        tables = pool.imap(_build_grid_table, [(c, self.__error, self.__engine) for c in curves], chunksize=1)
+        return (
+            FrechetGrid2D(c, self.__error, engine=self.__engine, spine_distance=L, distances=distances)
+            for c, (L, distances) in zip(curves, tables)
+        )
+
+    def __find_node(self, edge):
+        p1 = edge.get_point(0)
+        p2 = edge.get_point(1)
+        return self.__find_leaf((p1.x, p1.y, p2.x, p2.y))
+
+    def __find_leaf(self, key):
+        i = self.__edges.get(key)
+        return self.__leaves[i] if i is not None else None
+
+
+def _build_grid_table(args):
+    curve, error, engine = args
+    grid = FrechetGrid2D(curve, error, engine=engine)
+    return grid.spine_distance, grid.distances
+
+
+def _edge_index(coordinates):
+    # Maps the coordinates of every edge to its index; repeated edges resolve to their first occurrence
+    index = dict()
+    for i, key in enumerate(np.concatenate((coordinates[:-1], coordinates[1:]), axis=1).tolist()):
+        index.setdefault(tuple(key), i)
+
+    return index
+
+
+def _ragged_arange(counts):
+    # Concatenation of np.arange(count) for every count
+    return np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def _segment_distances(points, starts, ends):
+    # Distances from points to the segments from starts to ends, broadcast against each other
+    d = ends - starts
+    length2 = np.sum(d ** 2, axis=-1)
+    t = np.sum((points - starts) * d, axis=-1) / np.where(length2 > 0, length2, 1)
+    closest = starts + np.clip(t, 0, 1)[..., None] * d
+    return np.sqrt(np.sum((points - closest) ** 2, axis=-1))
+
+
+def _coordinates(points):
+    return np.array([[p.x, p.y] for p in points], dtype=np.float64).reshape(-1, 2)
@@ -17,7 +17,22 @@ class ExponentialGrid2D(object):
     p such that alpha <= ||p - u|| <= beta, we can retrieve in O(1) time a grid point p'
     such that ||p - p'|| <= (error / 2) * ||p - u||.
 
-    Note that construction of the data structure takes O(error ** -2 * log(beta / alpha)) time.
+    Every grid point is given a stable integer index, namely its position in points and
+    coordinates, so that values associated with grid points can be stored in dense arrays.
+
+    The grid is implicit. Level i covers the hypercube of side length 2 ** (i + 2) * alpha
+    centered at u with a lattice of cell width error * 2 ** (i + 2) * alpha / (4 * sqrt(2)),
+    leaving out the cells lying inside the hypercube of level i - 1. The level, cell and
+    closest lattice point of a query point are therefore computed arithmetically.
+
+    Moreover, the grid only depends on u and alpha through a translation and a scaling: its shape
+    is fixed by error and the number of levels, ceil(log(beta / alpha)). The coordinates of the grid
+    points relative to u, in units of alpha, and the lattice-to-index table of every level are thus
+    computed once per shape and shared by all grids of that shape in the process. A grid only stores
+    its center and alpha, and computes the coordinates of its points from the shared template.
+
+    Note that construction of the first grid of each shape takes O(error ** -2 * log(beta / alpha))
+    time, while every other grid is built in O(1) time.
     """
 
     def __init__(self, point, error, alpha, beta):
@@ -25,149 +40,128 @@ class ExponentialGrid2D(object):
         self.__alpha = alpha if alpha <= beta else beta
         self.__beta = beta if beta >= alpha else alpha
         self.center = point
-        self.grids, self.points = self.__init_grids(error)
+        self.__error = error
+
+        # Every level has the same number of cells along each axis
+        self.__levels = max(int(ceil(log(self.__beta / self.__alpha, 2))), 1)
+        self.__cells = int(ceil(4 * sqrt(2) / error))
+        self.__unit, self.__index = _template(error, self.__levels)
+
+    def __len__(self):
+        return len(self.__unit)
+
+    @property
+    def coordinates(self):
+        """
+        The (m, 2) array of the coordinates of all grid points, computed from the template on every access.
+        """
+        return self.coordinates_at(slice(None))
+
+    @property
+    def points(self):
+        return [Point2D(x, y) for x, y in self.coordinates.tolist()]
+
+    def coordinates_at(self, indices):
+        """
+        Returns the coordinates of the grid points with the given indices.
+        """
+        return [self.center.x, self.center.y] + self.__alpha * self.__unit[indices]
 
     def approximate_point(self, point):
-        assert self.__alpha <= np.linalg.norm(point.v - self.center.v) <= self.__beta, \
+        x, y = self.coordinates_at(self.approximate_index(point)).tolist()
+        return Point2D(x, y)
+
+    def approximate_index(self, point):
+        return int(self.approximate_indices([[point.x, point.y]])[0])
+
+    def approximate_points(self, points):
+        return self.coordinates_at(self.approximate_indices(points))
+
+    def approximate_indices(self, points):
+        """
+        Returns the indices of the grid points approximating each point of the (m, 2) array points.
+        """
+        diff = np.asarray(points, dtype=np.float64).reshape(-1, 2) - [self.center.x, self.center.y]
+        extent = np.max(np.abs(diff), axis=1)
+        assert np.all(extent <= 2 ** self.__levels * self.__alpha * (1 + 1e-9)), \
             'Point given falls outside of the grid.'
 
-        x_diff = point.x - self.center.x
-        y_diff = point.y - self.center.y
+        # Level i is the smallest whose hypercube, of half side 2 ** (i + 1) * alpha, contains the point
+        with np.errstate(divide='ignore'):
+            level = np.ceil(np.log2(extent / self.__alpha) - 1)
+        level = np.clip(np.nan_to_num(level), 0, self.__levels - 1).astype(np.int64)
+
+        half_side = 2.0 ** (level + 1) * self.__alpha
+        width = self.__error * 2 * half_side / (4 * sqrt(2))
+        lattice = (diff + half_side[:, None]) / width[:, None]
 
-        # Compute index of grid containing the point
-        if point == self.center:
-            i = 0
-        elif x_diff == 0 and y_diff != 0:
-            i = int(ceil(log(abs(y_diff) / self.__alpha, 2) - 1))
-        elif y_diff == 0 and x_diff != 0:
-            i = int(ceil(log(abs(x_diff) / self.__alpha, 2) - 1))
-        else:
-            i = int(max(
-                ceil(log(abs(x_diff) / self.__alpha, 2) - 1),
-                ceil(log(abs(y_diff) / self.__alpha, 2) - 1)
-            ))
+        # The closest corner of the cell containing the point that belongs to the level
+        cell = np.clip(np.floor(lattice), 0, self.__cells - 1).astype(np.int64)
+        candidates = np.stack([
+            cell + [[0, 0]], cell + [[0, 1]], cell + [[1, 0]], cell + [[1, 1]]
+        ], axis=1)
+        distances = np.sum((candidates - lattice[:, None, :]) ** 2, axis=2)
 
-        return self.grids[i].get_cell(point).find_closest(point)
+        index = self.__index[level[:, None], candidates[:, :, 1], candidates[:, :, 0]]
+        distances[index < 0] = np.inf
+        assert np.all(np.isfinite(np.min(distances, axis=1))), \
+            'Point given falls inside a removed cell of the grid.'
+
+        return index[np.arange(len(index)), np.argmin(distances, axis=1)]
 
     def points_iter(self):
-        for grid in self.grids:
-            for point in grid.points:
-                yield point
+        for point in self.points:
+            yield point
+
+
+# Grid templates shared by the whole process, keyed by error and number of levels
+_TEMPLATES = dict()
 
-    def __init_hcubes(self, point):
-        hcubes = list()
 
-        for i in range(0, int(ceil(log(self.__beta / self.__alpha, 2)))):
-            hcubes.append(HyperCube2D(2 ** (i + 2) * self.__alpha, point))
+def _template(error, levels):
+    """
+    Returns the coordinates of the points of a grid centered at the origin with alpha = 1, along with
+    the lattice-to-index table of each of its levels. Both arrays are shared and must not be modified.
+    """
+    template = _TEMPLATES.get((error, levels))
+    if template is None:
+        template = _TEMPLATES[(error, levels)] = _build_template(error, levels)
 
-        return hcubes
+    return template
 
-    def __init_grids(self, error):
-        grids = list()
-        points = list()
-        last_hcube = None
 
-        hcubes = self.__init_hcubes(self.center)
-        for hcube in hcubes:
-            cell_width = (error * hcube.sidelength) / (4 * sqrt(2))
-            grids.append(Grid2D(hcube, cell_width, last_hcube))
-            points += [pt for pt in grids[-1].points]
-            last_hcube = hcube
+def _build_template(error, levels):
+    n = int(ceil(4 * sqrt(2) / error))
 
-        return grids, np.array(points)
+    coordinates = list()
+    index = np.full((levels, n + 1, n + 1), -1, dtype=np.int64)
+    count = 0
 
+    for i in range(0, levels):
+        side = 2 ** (i + 2)
+        width = error * side / (4 * sqrt(2))
+        lines = np.arange(0, n + 1) * width - side / 2
 
-class HyperCube2D(object):
-    def __init__(self, sidelength, point):
-        half_sl = sidelength / 2
-        self.tl = Point2D(point.x - half_sl, point.y - half_sl)
-        self.tr = Point2D(point.x + half_sl, point.y - half_sl)
-        self.bl = Point2D(point.x - half_sl, point.y + half_sl)
-        self.br = Point2D(point.x + half_sl, point.y + half_sl)
-        self.sidelength = sidelength
+        # Cells lying entirely inside the previous level's hypercube are left out
+        kept = np.ones((n, n), dtype=bool)
+        if i > 0:
+            inside = (lines[:-1] >= -side / 4) & (lines[1:] <= side / 4)
+            kept = ~(inside[:, None] & inside[None, :])
 
+        # A lattice point belongs to the level if any kept cell has it as a corner
+        corners = np.zeros((n + 1, n + 1), dtype=bool)
+        corners[:-1, :-1] |= kept
+        corners[:-1, 1:] |= kept
+        corners[1:, :-1] |= kept
+        corners[1:, 1:] |= kept
 
-class Grid2D(object):
-    def __init__(self, hcube, cell_width, last_hcube=None):
-        self.tl = hcube.tl
-        self.cell_width = cell_width
-        self.grid, self.points = self.__init_grid(hcube, cell_width, last_hcube)
+        rows, cols = np.nonzero(corners)
+        index[i, rows, cols] = np.arange(count, count + len(rows))
+        count += len(rows)
 
-    def get_cell(self, point):
-        return self.grid[
-            int(ceil(abs(self.tl.y - point.y) / self.cell_width) - 1)
-        ][
-            int(ceil(abs(self.tl.x - point.x) / self.cell_width) - 1)
-        ]
+        coordinates.append(np.stack((lines[cols], lines[rows]), axis=1))
 
-    def points_iter(self):
-        for i in range(0, len(self.grid)):
-            for j in range(0, len(self.grid[i])):
-                if self.grid[i][j]:
-                    for point in self.grid[i][j].points:
-                        yield point
-
-    @staticmethod
-    def __init_grid(hcube, cell_width, last_hcube):
-        grid = list()
-        points = set()
-
-        num_cells = int(ceil(hcube.sidelength / cell_width))
-        assert num_cells > 0, 'Invalid hypercube side length and grid cell width specified.'
-
-        last = hcube.tl
-        for i in range(0, num_cells):
-            grid.append(list())
-
-            for j in range(0, num_cells):
-                new_cell = Grid2D.__GridCell2D(cell_width, last)
-
-                if last_hcube and new_cell.is_in(last_hcube):
-                    grid[i].append(None)
-                else:
-                    grid[i].append(new_cell)
-
-                    # Add cell points to the grid's point set
-                    points.add(new_cell.tl)
-                    points.add(new_cell.tr)
-                    points.add(new_cell.bl)
-                    points.add(new_cell.br)
-
-                last = new_cell.tr
-
-            last = grid[i][0].bl
-
-        return grid, np.array(list(points))
-
-    class __GridCell2D(object):
-        def __init__(self, sidelength, tl_point):
-            self.tl = tl_point
-            self.tr = Point2D(tl_point.x + sidelength, tl_point.y)
-            self.bl = Point2D(tl_point.x, tl_point.y + sidelength)
-            self.br = Point2D(tl_point.x + sidelength, tl_point.y + sidelength)
-            self.points = [
-                self.tl,
-                self.tr,
-                self.bl,
-                self.br
-            ]
-
-        def find_closest(self, point):
-            closest = self.points[0]
-            min_dist = np.linalg.norm(point.v - closest.v)
-
-            for p in self.points[1:]:
-                dist = np.linalg.norm(point.v - p.v)
-
-                if dist < min_dist:
-                    closest = p
-                    min_dist - dist
-
-            return closest
-
-        def is_in(self, hcube):
-            if hcube.tl.x <= self.tl.x <= self.tr.x <= hcube.tr.x and \
-                    hcube.tl.y <= self.tl.y <= self.bl.y <= hcube.bl.y:
-                return True
-
-            return False
+    coordinates = np.concatenate(coordinates)
+    coordinates.setflags(write=False)
+    index.setflags(write=False)
+    return coordinates, index
@@ -1,11 +1,20 @@
 from __future__ import division
 
+from itertools import count
+from math import hypot
+
 import numpy as np
-from geometry.data_structures.curve import Edge2D
 
 from geometry import STEINER_SPACING
-from geometry.algorithms.frechet_distance import discrete_frechet
+from geometry.algorithms.frechet_distance import MAX_BATCH_CELLS, continuous_frechet_segments, \
+    discrete_frechet_segments
+from geometry.data_structures.curve import sub_divide_array
 from geometry.data_structures.exponential_grid import ExponentialGrid2D
+from geometry.utils import instrumentation
+from geometry.utils.cache import TABLE_CACHE
+
+# Distinguishes the cached rows of lazily built grids
+_keys = count()
 
 
 class FrechetGrid2D(object):
@@ -16,7 +25,9 @@ class FrechetGrid2D(object):
     The data structure computes the exponential grids G(u) and G(v) of the spine of the
     curve uv and, for each segment in G(u) x G(v), pre-computes the Frechet distance between
     that segment and the given curve. This allows for (1 + error)-approximate Frechet matching
-    queries to execute in O(1) time.
+    queries to execute in O(1) time. The pre-computed distances are stored in a dense
+    (|G(u)|, |G(v)|) array indexed by the integer indices of the grid points, optionally
+    in single precision by passing dtype=numpy.float32.
 
     Note that construction of the data structure takes O(X ** 2 * n * log(n)) time, where
     X = error ** -2 * log(1 / error).
@@ -27,49 +38,243 @@ class FrechetGrid2D(object):
     the Frechet Distance Between Two Polygonal Curves by Helmut Alt and Michael Godau that shows
     it is possible in O(n * log(n)) time to compute the continuous Frechet distance between a line
     segment and a curve with n segments. The implementation, however, relies on parametric searching
-    and therefore lends itself to high constant values. We therefore save time in place of accuracy
-    by computing the Discrete Frechet distance in O(n) time.
+    and therefore lends itself to high constant values. By default we therefore save time in place
+    of accuracy by computing the Discrete Frechet distance over Steiner points placed STEINER_SPACING
+    apart, which takes time proportional to the length of the curve rather than its number of vertices.
+
+    Passing engine='continuous' instead computes the continuous Frechet distance over the vertices of
+    the curve using its free space intervals, see continuous_frechet_segments. Its cost only depends
+    on the number of vertices of the curve.
+
+    Passing lazy=True defers all pre-processing until the grid is first queried. The distances
+    from each grid point of G(u) to G(v) are then computed the first time they are needed and
+    kept in the shared, memory bounded TABLE_CACHE, from which the least recently used are evicted.
     """
 
-    def __init__(self, curve, error):
+    ENGINES = ('discrete', 'continuous')
+
+    def __init__(self, curve, error, dtype=np.float64, engine='discrete', spine_distance=None, distances=None,
+                 lazy=False):
         assert 0 < error <= 1, 'Error rate specified must be greater than 0 and at most 1.'
+        assert engine in self.ENGINES, 'Unknown Frechet engine {}.'.format(engine)
         self.__u, self.__v = curve.get_spine()
-        self.__steiner_curve = curve.get_steiner_curve(STEINER_SPACING)
-        self.__L = discrete_frechet(Edge2D(self.__u, self.__v).get_steiner_curve(STEINER_SPACING),
-                                    curve.get_steiner_curve(STEINER_SPACING))
+        self.__source = curve
+        self.__engine = engine
         self.__error = error
-        self.grid_u = ExponentialGrid2D(self.__u, error, error * self.__L / 2, self.__L / error) \
-            if self.__L != 0 else None
-        self.grid_v = ExponentialGrid2D(self.__v, error, error * self.__L / 2, self.__L / error) \
-            if self.__L != 0 else None
-        self.distances = self.__init_distances(curve) if self.__L != 0 else None
+        self.__dtype = dtype
+        self.__key = next(_keys)
+        self.__lazy = lazy
+        self.__L = None
+        self.grid_u = None
+        self.grid_v = None
+
+        # A previously computed spine distance and table may be supplied to skip the pre-processing
+        self.distances = distances
+
+        # The curve matched against is fetched once for the whole pre-processing, as curves only
+        # remember their Steiner points while they are in use
+        curve = self.__curve() if not lazy and (spine_distance is None or distances is None) else None
+
+        if not lazy or spine_distance is not None:
+            self.__init_grids(spine_distance, curve)
+
+        if not lazy and self.distances is None and self.__L != 0:
+            self.distances = self.__init_distances(curve)
+
+    @property
+    def spine_distance(self):
+        if self.__L is None:
+            self.__init_grids()
+
+        return self.__L
+
+    def table(self):
+        """
+        Returns the full distance table, computing it when the grid is lazy.
+        """
+        if self.distances is not None or self.spine_distance == 0:
+            return self.distances
+
+        return self.__init_distances()
 
     def approximate_frechet(self, edge):
         p = edge.p1
         q = edge.p2
 
-        r = max(np.linalg.norm(p.v - self.__u.v), np.linalg.norm(q.v - self.__v.v))
+        if self.__L is None:
+            self.__init_grids()
+
+        r = max(hypot(p.x - self.__u.x, p.y - self.__u.y), hypot(q.x - self.__v.x, q.y - self.__v.y))
 
         if r <= self.__error * self.__L / 2:
             return self.__L - r
         elif r >= self.__L / self.__error:
             return r
 
-        p_prime = self.grid_u.approximate_point(p)
-        q_prime = self.grid_v.approximate_point(q)
+        i = self.grid_u.approximate_index(p)
+        j = self.grid_v.approximate_index(q)
+        p_x, p_y = self.grid_u.coordinates_at(i).tolist()
+        q_x, q_y = self.grid_v.coordinates_at(j).tolist()
+
+        distance = self.distances[i, j] if self.distances is not None else self.__row(i)[j]
+        return float(distance) - max(hypot(p.x - p_x, p.y - p_y), hypot(q.x - q_x, q.y - q_y))
+
+    def approximate_frechet_many(self, starts, ends):
+        """
+        Vectorized approximate_frechet for the segments whose endpoints are given by the (m, 2)
+        arrays starts and ends.
+        """
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+
+        if self.__L is None:
+            self.__init_grids()
 
-        return self.distances[str(p_prime)][str(q_prime)] - \
-               max(np.linalg.norm(p.v - p_prime.v), np.linalg.norm(q.v - q_prime.v))
+        r = np.maximum(
+            np.hypot(starts[:, 0] - self.__u.x, starts[:, 1] - self.__u.y),
+            np.hypot(ends[:, 0] - self.__v.x, ends[:, 1] - self.__v.y)
+        )
 
-    def __init_distances(self, curve):
-        distances = dict()
+        near = r <= self.__error * self.__L / 2
+        far = ~near & (r >= self.__L / self.__error)
+        result = np.where(near, self.__L - r, r)
 
-        for p_prime in self.grid_u.points:
-            distances[str(p_prime)] = dict()
+        rows = np.flatnonzero(~(near | far))
+        if len(rows) > 0:
+            i = self.grid_u.approximate_indices(starts[rows])
+            j = self.grid_v.approximate_indices(ends[rows])
+            p_prime = self.grid_u.coordinates_at(i)
+            q_prime = self.grid_v.coordinates_at(j)
 
-            for q_prime in self.grid_v.points:
-                distances[str(p_prime)][str(q_prime)] = \
-                    discrete_frechet(Edge2D(p_prime, q_prime).get_steiner_curve(STEINER_SPACING),
-                                     curve.get_steiner_curve(STEINER_SPACING))
+            if self.distances is not None:
+                distances = self.distances[i, j]
+            else:
+                distances = np.empty(len(rows))
+                for row in np.unique(i).tolist():
+                    distances[i == row] = self.__row(row)[j[i == row]]
+
+            result[rows] = distances - np.maximum(
+                np.hypot(*(starts[rows] - p_prime).T),
+                np.hypot(*(ends[rows] - q_prime).T)
+            )
+
+        return result
+
+    def __init_grids(self, spine_distance=None, curve=None):
+        if spine_distance is None:
+            spine_distance = self.__segment_distances(
+                [[self.__u.x, self.__u.y]], [[self.__v.x, self.__v.y]], curve
+            )[0]
+
+        error = self.__error
+        self.__L = spine_distance
+        self.grid_u = ExponentialGrid2D(self.__u, error, error * self.__L / 2, self.__L / error) \
+            if self.__L != 0 else None
+        self.grid_v = ExponentialGrid2D(self.__v, error, error * self.__L / 2, self.__L / error) \
+            if self.__L != 0 else None
+
+        stats = instrumentation.STATS
+        if stats is not None and self.__L != 0:
+            stats.count('grids')
+            stats.count('grid_points', len(self.grid_u) + len(self.grid_v))
+
+    def __init_distances(self, curve=None):
+        coords_u = self.grid_u.coordinates
+        coords_v = self.grid_v.coordinates
+        distances = np.empty((len(coords_u), len(coords_v)), dtype=self.__dtype)
+
+        # The segments in G(u) x G(v) are matched against the curve a block of rows at a time, so that
+        # no more than MAX_BATCH_CELLS of them are laid out at once
+        rows = max(1, MAX_BATCH_CELLS // len(coords_v))
+        curve = curve if curve is not None else self.__curve()
+        for i in range(0, len(coords_u), rows):
+            block = coords_u[i:i + rows]
+            distances[i:i + len(block)] = self.__segment_distances(
+                np.repeat(block, len(coords_v), axis=0),
+                np.tile(coords_v, (len(block), 1)),
+                curve
+            ).reshape(len(block), len(coords_v))
 
         return distances
+
+    def __row(self, i):
+        # Distances from grid point i of G(u) to every grid point of G(v), computed on first use
+        def compute():
+            coords_v = self.grid_v.coordinates
+            return self.__segment_distances(
+                np.repeat(self.grid_u.coordinates_at(slice(i, i + 1)), len(coords_v), axis=0),
+                coords_v
+            ).astype(self.__dtype)
+
+        return TABLE_CACHE.get((self.__key, i), compute)
+
+    def __segment_distances(self, starts, ends, curve=None):
+        stats = instrumentation.STATS
+        if stats is not None:
+            stats.count('table_cells', len(starts))
+
+        curve = curve if curve is not None else self.__curve()
+        if self.__engine == 'continuous':
+            return continuous_frechet_segments(starts, ends, curve)
+
+        return discrete_frechet_segments(starts, ends, curve, STEINER_SPACING)
+
+    def __curve(self):
+        # The vertices matched against by the engine, which for the discrete one are the Steiner points
+        if self.__engine == 'continuous':
+            return self.__source.as_array()
+
+        # Lazy grids keep their own Steiner points in the shared cache alongside their rows
+        if self.__lazy:
+            return TABLE_CACHE.get((self.__key, 'curve'),
+                                   lambda: sub_divide_array(self.__source.as_array(), STEINER_SPACING))
+
+        # Otherwise they are shared with the curves the source was split from or into while in use
+        return self.__source.get_steiner_curve(STEINER_SPACING).as_array()
+
+
+class SegmentFrechetGrid2D(object):
+    """
+    Answers the queries of FrechetGrid2D for a curve made of the single segment uv, without building
+    any grid or distance table.
+
+    The Frechet distance between segments pq and uv is max(||p - u||, ||q - v||): the distance between
+    two points moving linearly along the segments is convex, so it peaks at either end when both move at
+    the same rate. Queries are therefore answered exactly in O(1) time.
+    """
+
+    def __init__(self, edge):
+        self.__u, self.__v = edge.get_spine()
+        self.grid_u = None
+        self.grid_v = None
+        self.distances = None
+
+    @property
+    def spine_distance(self):
+        return 0.0
+
+    def table(self):
+        return None
+
+    def approximate_frechet(self, edge):
+        return max(hypot(edge.p1.x - self.__u.x, edge.p1.y - self.__u.y),
+                   hypot(edge.p2.x - self.__v.x, edge.p2.y - self.__v.y))
+
+    def approximate_frechet_many(self, starts, ends):
+        return SegmentFrechetGrid2D.frechet_many(starts, ends, [self.__u.x, self.__u.y], [self.__v.x, self.__v.y])
+
+    @staticmethod
+    def frechet_many(starts, ends, u, v):
+        """
+        Returns the Frechet distances between the segments from starts to ends and the segments from u
+        to v, all given as (m, 2) arrays or single points broadcast against the others.
+        """
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+        u = np.asarray(u, dtype=np.float64).reshape(-1, 2)
+        v = np.asarray(v, dtype=np.float64).reshape(-1, 2)
+
+        return np.maximum(
+            np.hypot(starts[:, 0] - u[:, 0], starts[:, 1] - u[:, 1]),
+            np.hypot(ends[:, 0] - v[:, 0], ends[:, 1] - v[:, 1])
+        )
@@ -1,5 +1,10 @@
+from multiprocessing import Pool
+
 from geometry.data_structures.curve import Edge2D, PolygonalCurve2D
 from geometry.data_structures.curve_range_tree import CurveRangeTree2D
+from geometry.data_structures.tree import Tree
+from geometry.utils import instrumentation
+from geometry.utils.storage import read_arrays, write_arrays
 
 
 class FrechetTree(object):
@@ -17,18 +22,61 @@ class FrechetTree(object):
     x to y.
 
     Note that construction of the data structure takes O((1 / error ** 4) * log ** 2 (n / error) * log ** 2 (n)) time.
+
+    Passing workers > 1 builds the grids of all paths in one pool of that many processes, see CurveRangeTree2D.
+
+    A built data structure can be written to disk with save and restored with load, see CurveRangeTree2D.
     """
 
-    def __init__(self, tree, error, delta):
+    def __init__(self, tree, error, delta, engine='discrete', workers=1, lazy=False):
         self.__error = error
         self.__delta = delta
         self.tree = tree
         self.path_trees = dict()
 
-        self.tree.decompose(embedded_nodes=True)
-        for path in self.tree.decomposition:
-            self.path_trees[str(path)] = CurveRangeTree2D(path, error, delta)
+        self.tree.decompose(embedded_nodes=True, lca_index=True)
+
+        # The grids of every path are built in one pool rather than one per path
+        pool = Pool(workers) if workers > 1 and not lazy else None
+        try:
+            for path in self.tree.decomposition:
+                self.path_trees[str(path)] = CurveRangeTree2D(path, error, delta, engine, workers, lazy, pool)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
+    def save(self, path):
+        # Nodes are listed in pre-order with their children in order, so load rebuilds the same tree
+        points, parents = self.tree.parent_array()
+        metadata = {'error': self.__error, 'delta': self.__delta, 'paths': list()}
+        arrays = {'tree/points': points, 'tree/parents': parents}
+
+        for i, curve in enumerate(self.tree.decomposition):
+            path_metadata, path_arrays = self.path_trees[str(curve)].to_arrays('path{}/'.format(i))
+            metadata['paths'].append(path_metadata)
+            arrays.update(path_arrays)
+
+        write_arrays(path, arrays, metadata)
+
+    @staticmethod
+    def load(path, mmap=True):
+        metadata, arrays = read_arrays(path, mmap)
+
+        frechet_tree = FrechetTree.__new__(FrechetTree)
+        frechet_tree.__error = metadata['error']
+        frechet_tree.__delta = metadata['delta']
+        frechet_tree.tree = Tree.from_parent_array(arrays['tree/points'], arrays['tree/parents'])
+        frechet_tree.path_trees = dict()
+
+        frechet_tree.tree.decompose(embedded_nodes=True, lca_index=True)
+        for i, curve in enumerate(frechet_tree.tree.decomposition):
+            frechet_tree.path_trees[str(curve)] = \
+                CurveRangeTree2D.from_arrays(metadata['paths'][i], arrays, 'path{}/'.format(i))
+
+        return frechet_tree
+
+    @instrumentation.query
     def is_approximate(self, q_edge, x, y, x_node, y_node):
         # Assume tree node data stores Point2D objects
         x_edge = Edge2D(x_node.point, x_node.parent.point)
@@ -37,7 +85,20 @@ class FrechetTree(object):
         lca = self.tree.lowest_common_ancestor(x_node, y_node)
         paths = self.__find_decomposed_curves(x_node, lca) + self.__find_decomposed_curves(y_node, lca)[::-1]
 
+        # Path trees only differ by their grids, which travel with the subpaths, so any of them decides the query
+        path_tree = next(iter(self.path_trees.values()))
+
         subpaths = list()
+        if len(paths) == 0:
+            # T[x, y] lies along the single path holding both nodes, which runs down from their ancestor
+            if lca == y_node:
+                x, y, x_node, y_node = y, x, y_node, x_node
+                q_edge = Edge2D(q_edge.p2, q_edge.p1)
+
+            curve = [c for c in y_node.decomp_curves if c in x_node.decomp_curves][0]
+            subpaths += self.path_trees[str(curve)].partition_path(
+                x, y, Edge2D(x_node.parent.point, x_node.point), Edge2D(y_node.parent.point, y_node.point))
+
         for i in range(0, len(paths)):
             path = paths[i]
             curve_tree = self.path_trees.get(str(path))
@@ -52,7 +113,7 @@ class FrechetTree(object):
                 subpaths += curve_tree.partition_path(start, end,
                                                       Edge2D(start, path.get_point(1)), Edge2D(path.get_point(-2), end))
 
-        return self.path_trees.values()[0].find_frechet_bottleneck(q_edge, subpaths)
+        return path_tree.decide(q_edge, subpaths)
 
     @staticmethod
     def __find_decomposed_curves(start, end):
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class Graph(object):
     def __init__(self):
         self.graph = dict()
@@ -48,16 +51,128 @@ class DirectedAcyclicGraph(Graph):
         return False
 
     def bottleneck_path_weight(self, start, end):
-        def __compute_bottleneck(start, weight):
-            adjacencies = self.graph.get(str(start))
-            if start == end or not adjacencies:
-                return weight
+        return self.bottleneck_path(start, end)[0]
+
+    def bottleneck_path(self, start, end):
+        """
+        Returns the weight of the bottleneck path from start to end, the path minimizing its heaviest
+        edge, along with the vertices of that path. If end cannot be reached from start, the weight is
+        infinite and the path is empty.
+
+        Vertices are relaxed in topological order, so the path is found in O(V + E) time.
+        """
+        best = {str(start): 0}
+        previous = dict()
+
+        for key in self.__topological_order():
+            weight = best.get(key)
+            adjacencies = self.graph.get(key)
+            if weight is None or not adjacencies or key == str(end):
+                continue
 
-            weight = max(min(adjacencies.weights.values()), weight)
-            weights = list()
             for point in adjacencies.points:
-                weights.append(__compute_bottleneck(point, adjacencies.weights[str(point)]))
+                candidate = max(weight, adjacencies.weights[str(point)])
+                if candidate < best.get(str(point), float('inf')):
+                    best[str(point)] = candidate
+                    previous[str(point)] = adjacencies.origin
+
+        if str(end) not in best:
+            return float('inf'), list()
 
-            return max(min(weights), weight)
+        path = [end]
+        while str(path[-1]) != str(start):
+            path.append(previous[str(path[-1])])
 
-        return __compute_bottleneck(start, 0)
+        return best[str(end)], path[::-1]
+
+    def __topological_order(self):
+        in_degree = dict()
+        for adjacencies in self.graph.values():
+            for point in adjacencies.points:
+                in_degree[str(point)] = in_degree.get(str(point), 0) + 1
+
+        order = [key for key in self.graph if key not in in_degree]
+        for key in order:
+            adjacencies = self.graph.get(key)
+            if not adjacencies:
+                continue
+
+            for point in adjacencies.points:
+                in_degree[str(point)] -= 1
+                if in_degree[str(point)] == 0:
+                    order.append(str(point))
+
+        return order
+
+
+class LayeredGraph(object):
+    """
+    A DAG whose vertices are the integers 0, ..., V - 1 split into consecutive layers, with edges only
+    running from one layer to the next. The weights of the edges between layers k and k + 1 are held in
+    a dense (n_k, n_k+1) array, with np.inf marking missing edges, and are added in bulk.
+    """
+
+    def __init__(self, sizes):
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.offsets = np.cumsum(self.sizes) - self.sizes
+        self.weights = [np.full((self.sizes[k], self.sizes[k + 1]), np.inf) for k in range(0, len(self.sizes) - 1)]
+
+    def num_vertices(self):
+        return int(np.sum(self.sizes))
+
+    def num_edges(self):
+        return int(sum(np.count_nonzero(np.isfinite(w)) for w in self.weights))
+
+    def vertex(self, k, i):
+        return int(self.offsets[k] + i)
+
+    def add_edges(self, k, sources, targets, weights):
+        """
+        Adds the edges from vertex sources[e] of layer k to vertex targets[e] of layer k + 1, where
+        sources and targets index vertices within their layer.
+        """
+        self.weights[k][np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)] = weights
+
+    def bottleneck_path_weight(self):
+        return self.bottleneck_path()[0]
+
+    def bottleneck_path(self):
+        """
+        Returns the weight of the bottleneck path from the first to the last layer, both of which must
+        hold a single vertex, along with the vertices of that path, see bottleneck_layers.
+        """
+        assert self.sizes[0] == 1 and self.sizes[-1] == 1, 'The first and last layers must hold a single vertex.'
+        weight, path = bottleneck_layers(self.weights)
+        return weight, [self.vertex(k, i) for k, i in enumerate(path)]
+
+
+def bottleneck_layers(weights):
+    """
+    Computes the bottleneck path through a layered DAG whose first and last layers hold a single vertex.
+
+    weights[k] is an (n_k, n_k+1) array holding the weights of the edges from layer k to layer k + 1,
+    with np.inf marking missing edges. Consecutive layers are combined with a min-max matrix product,
+    so the whole path is found in O(V + E) time with one vectorized operation per layer. Returns the
+    weight of the path along with the index of the vertex it visits in every layer.
+    """
+    best = np.zeros(1)
+    previous = list()
+
+    for w in weights:
+        # An empty layer disconnects the first layer from the last
+        if w.size == 0:
+            return float('inf'), list()
+
+        candidates = np.maximum(best[:, None], w)
+        previous.append(np.argmin(candidates, axis=0))
+        best = candidates[previous[-1], np.arange(candidates.shape[1])]
+
+    weight = float(best[0])
+    if np.isinf(weight):
+        return weight, list()
+
+    path = [0]
+    for p in previous[::-1]:
+        path.append(int(p[path[-1]]))
+
+    return weight, path[::-1]
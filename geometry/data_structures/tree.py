@@ -1,12 +1,53 @@
 from math import floor, log
+from timeit import default_timer
 
-from geometry.data_structures.curve import PolygonalCurve2D
+import numpy as np
+
+from geometry.data_structures.curve import ArrayCurve2D, PolygonalCurve2D
+from geometry.data_structures.point import Point2D
 
 
 class Tree(object):
     def __init__(self, root=None):
         self.root = root
         self.decomposition = None
+        self.stats = dict()
+        self.__tour = None
+        self.__depths = None
+        self.__sparse = None
+
+    def parent_array(self):
+        """
+        Returns the (n, 2) array of the coordinates of the nodes and the array of the index of the parent
+        of every node, -1 for the root, with nodes numbered in pre-order and their children in order.
+        """
+        nodes, parents = _pre_order(self.root, lambda node: list(node.children()))
+        points = np.array([(node.point.x, node.point.y) for node in nodes], dtype=np.float64).reshape(-1, 2)
+        return points, np.array(parents, dtype=np.int64)
+
+    @staticmethod
+    def from_parent_array(coordinates, parents):
+        """
+        Builds a tree of linked Node objects holding Point2D objects from the (n, 2) array of the
+        coordinates of the nodes and the array of their parents, see parent_array. Children are linked
+        in index order.
+        """
+        nodes = [Tree.Node(Point2D(x, y)) for x, y in np.asarray(coordinates).tolist()]
+        parents = np.asarray(parents).tolist()
+        last_child = dict()
+
+        for i, parent in enumerate(parents):
+            if parent < 0:
+                continue
+
+            nodes[i].parent = nodes[parent]
+            if parent in last_child:
+                last_child[parent].right_sibling = nodes[i]
+            else:
+                nodes[parent].left_child = nodes[i]
+            last_child[parent] = nodes[i]
+
+        return Tree(root=nodes[parents.index(-1)])
 
     class Node(object):
         def __init__(self, point, parent=None):
@@ -68,18 +109,21 @@ class Tree(object):
     # noinspection PyUnreachableCode
     @staticmethod
     def post_order_traversal(node):
-        def __iter(n):
-            for child in n.children():
-                for i in __iter(child):
-                    yield i
-            yield n
+        if not node:
+            return
+            yield
 
-        if node:
-            for nd in __iter(node):
-                yield nd
+        # Each entry holds a node along with an iterator over its children left to visit
+        stack = [(node, node.children())]
+        while len(stack) > 0:
+            nxt, children = stack[-1]
+            child = next(children, None)
 
-        return
-        yield
+            if child is None:
+                stack.pop()
+                yield nxt
+            else:
+                stack.append((child, child.children()))
 
     # noinspection PyUnreachableCode
     def leaves(self, node):
@@ -90,7 +134,14 @@ class Tree(object):
         return
         yield
 
-    def decompose(self, embedded_nodes=False):
+    def decompose(self, embedded_nodes=False, lca_index=False):
+        """
+        Decomposes the tree into paths, returning them as curves if embedded_nodes is set.
+
+        If lca_index is set, an Euler tour of the tree is also recorded along with a sparse table of the
+        shallowest node over every power-of-two range of the tour, so that lowest_common_ancestor answers
+        in O(1) time. Building the index takes O(n log n) time and memory, both recorded in stats.
+        """
         curves = list()
 
         # Step 1: Compute size & magnitude of each subtree
@@ -137,9 +188,63 @@ class Tree(object):
             create_curve(stack)
 
         self.decomposition = curves
+
+        if lca_index:
+            start = default_timer()
+            self.__build_lca_index()
+            self.stats['lca_index_seconds'] = default_timer() - start
+            self.stats['lca_index_bytes'] = 8 * len(self.__tour) + self.__depths.nbytes + \
+                sum(level.nbytes for level in self.__sparse)
+
         return curves
 
+    def __build_lca_index(self):
+        tour = list()
+        depths = list()
+
+        stack = [(self.root, 0, iter(self.root.children()))]
+        self.root.tour_index = 0
+        tour.append(self.root)
+        depths.append(0)
+
+        while len(stack) > 0:
+            node, depth, children = stack[-1]
+            child = next(children, None)
+
+            if child is None:
+                stack.pop()
+                if len(stack) > 0:
+                    tour.append(stack[-1][0])
+                    depths.append(depth - 1)
+                continue
+
+            child.tour_index = len(tour)
+            tour.append(child)
+            depths.append(depth + 1)
+            stack.append((child, depth + 1, iter(child.children())))
+
+        # Level j holds, for every i, the position of the shallowest node in tour[i:i + 2 ** j]
+        self.__depths = np.array(depths, dtype=np.int64)
+        self.__sparse = [np.arange(len(tour), dtype=np.int64)]
+        while 2 ** len(self.__sparse) <= len(tour):
+            half = 2 ** (len(self.__sparse) - 1)
+            prev = self.__sparse[-1]
+            a = prev[:-half]
+            b = prev[half:]
+            self.__sparse.append(np.where(self.__depths[a] <= self.__depths[b], a, b))
+
+        self.__tour = tour
+
     def lowest_common_ancestor(self, u, v):
+        if self.__tour is not None:
+            i = min(u.tour_index, v.tour_index)
+            j = max(u.tour_index, v.tour_index) + 1
+            level = self.__sparse[(j - i).bit_length() - 1]
+
+            a = level[i]
+            b = level[j - 2 ** ((j - i).bit_length() - 1)]
+            return self.__tour[a if self.__depths[a] <= self.__depths[b] else b]
+
         assert u != self.root and v != self.root, 'Input nodes cannot be the root node.'
         assert u != v, 'Input nodes must be distinct'
         assert u.gpar and v.gpar, 'Tree must be decomposed prior to computing LCA.'
@@ -176,3 +281,368 @@ class Tree(object):
         # k != i and k != j:
         return u_seq[i - 1 - k].parent if u_seq[i - 1 - k].parent.size >= v_seq[j - 1 - k].parent.size \
             else v_seq[j - 1 - k].parent
+
+
+class ArrayTree(Tree):
+    """
+    A tree whose structure is held in flat arrays rather than in linked Node objects, for trees with
+    millions of nodes.
+
+    Node i is located at coordinates[i] and its parent is parents[i], with -1 marking the root. The
+    children of node i are child_indices[child_offsets[i]:child_offsets[i + 1]] in index order.
+
+    The Euler tour of the tree is ranked by pointer jumping, which takes O(log n) vectorized passes over
+    the nodes however deep the tree is. The pre-order, the depth of every node and the size of every
+    subtree are then derived from it with prefix sums, so neither traversals nor decompose recurse or
+    loop over the nodes in Python.
+
+    decompose computes the same size, ell and gpar of every node and the same paths as Tree.decompose,
+    storing them in arrays. Nodes are exposed through the Node API of Tree as thin views holding only
+    their index, created on demand.
+    """
+
+    def __init__(self, coordinates, parents):
+        self.coordinates = np.ascontiguousarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        self.parents = np.asarray(parents, dtype=np.int64)
+        assert len(self.parents) == len(self.coordinates), 'Every node needs a parent index.'
+
+        roots = np.flatnonzero(self.parents < 0)
+        assert len(roots) == 1, 'A tree must have exactly one root.'
+
+        # The root sorts first, all other nodes are grouped by parent in index order
+        n = len(self.parents)
+        self.child_indices = np.argsort(self.parents, kind='mergesort')[1:]
+        self.child_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.parents[self.child_indices], minlength=n), out=self.child_offsets[1:])
+
+        self.__euler_tour(int(roots[0]))
+        assert self.counts[roots[0]] == n, 'Every node must be reachable from the root.'
+
+        self.sizes = None
+        self.ells = None
+        self.gpars = None
+        self.path_nodes = None
+        self.path_offsets = None
+        self.path_index = None
+        self.__pre_depths = None
+        self.__sparse = None
+
+        super(ArrayTree, self).__init__(root=self.node(roots[0]))
+
+    class Node(object):
+        __slots__ = ('tree', 'index')
+
+        def __init__(self, tree, index):
+            self.tree = tree
+            self.index = index
+
+        def __eq__(self, other):
+            return isinstance(other, ArrayTree.Node) and self.tree is other.tree and self.index == other.index
+
+        def __ne__(self, other):
+            return not self == other
+
+        def __hash__(self):
+            return hash(self.index)
+
+        @property
+        def point(self):
+            x, y = self.tree.coordinates[self.index].tolist()
+            return Point2D(x, y)
+
+        @property
+        def parent(self):
+            return self.tree.node(self.tree.parents[self.index])
+
+        @property
+        def left_child(self):
+            start, stop = self.__children_range()
+            return self.tree.node(self.tree.child_indices[start]) if start < stop else None
+
+        @property
+        def right_sibling(self):
+            parent = self.tree.parents[self.index]
+            if parent < 0:
+                return None
+
+            siblings = self.tree.child_indices[self.tree.child_offsets[parent]:self.tree.child_offsets[parent + 1]]
+            k = int(np.searchsorted(siblings, self.index)) + 1
+            return self.tree.node(siblings[k]) if k < len(siblings) else None
+
+        @property
+        def gpar(self):
+            return self.tree.node(self.tree.gpars[self.index]) if self.tree.gpars is not None else None
+
+        @property
+        def size(self):
+            return int(self.tree.sizes[self.index])
+
+        @property
+        def ell(self):
+            return int(self.tree.ells[self.index])
+
+        @property
+        def decomp_curves(self):
+            tree = self.tree
+            if tree.path_offsets is None or not tree.decomposition.embedded_nodes:
+                return list()
+
+            # The path of the node, followed by the paths hanging off it
+            heads = tree.path_nodes[tree.path_offsets[:-1] + 1]
+            paths = [int(tree.path_index[self.index])] if tree.path_index[self.index] >= 0 else list()
+            paths += np.flatnonzero(tree.parents[heads] == self.index).tolist()
+            return [tree.decomposition[k] for k in paths]
+
+        def is_leaf(self):
+            start, stop = self.__children_range()
+            return start == stop
+
+        # noinspection PyUnreachableCode
+        def adjacent_nodes(self):
+            if self.parent:
+                yield self.parent
+
+            for child in self.children():
+                yield child
+
+            return
+            yield
+
+        # noinspection PyUnreachableCode
+        def children(self):
+            start, stop = self.__children_range()
+            for i in self.tree.child_indices[start:stop].tolist():
+                yield self.tree.node(i)
+
+            return
+            yield
+
+        def __children_range(self):
+            return int(self.tree.child_offsets[self.index]), int(self.tree.child_offsets[self.index + 1])
+
+    @staticmethod
+    def from_tree(tree):
+        """
+        Copies a tree of linked Tree.Node objects holding Point2D objects into an ArrayTree. Nodes are
+        numbered in pre-order with their children in order, so the children keep their order.
+        """
+        return ArrayTree(*tree.parent_array())
+
+    def node(self, i):
+        return self.Node(self, int(i)) if i >= 0 else None
+
+    def num_nodes(self):
+        return len(self.parents)
+
+    def pre_order(self):
+        """
+        Returns the indices of all nodes in the order depth_first_search visits them from the root.
+        """
+        return self.by_pre_order
+
+    def post_order(self):
+        """
+        Returns the indices of all nodes in the order post_order_traversal visits them from the root.
+        """
+        return self.by_pre_order[::-1]
+
+    # noinspection PyUnreachableCode
+    @staticmethod
+    def post_order_traversal(node):
+        if not node:
+            return
+            yield
+
+        # The subtree of a node spans a contiguous range of the pre-order, which reversed is a post-order
+        tree = node.tree
+        start = tree.pre[node.index]
+        for i in tree.by_pre_order[start:start + tree.counts[node.index]][::-1].tolist():
+            yield tree.node(i)
+
+    def decompose(self, embedded_nodes=False, lca_index=False):
+        """
+        Decomposes the tree as Tree.decompose does, see ArrayTree.
+
+        The nodes of path k are path_nodes[path_offsets[k]:path_offsets[k + 1]], starting at the parent of
+        the path's topmost node. Paths are returned as a sequence creating each one on demand, as a list of
+        nodes or, with embedded_nodes set, as an ArrayCurve2D view into a single array of coordinates.
+        """
+        n = self.num_nodes()
+        root = self.root.index
+        degrees = np.diff(self.child_offsets)
+
+        # Step 1: Compute size & magnitude of each subtree, counting the leaves over its pre-order range
+        leaves = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(degrees[self.by_pre_order] == 0, out=leaves[1:])
+        self.sizes = leaves[self.pre + self.counts] - leaves[self.pre]
+        self.ells = np.frexp(self.sizes)[1].astype(np.int64) - 1
+
+        # Step 2: A node extends the path of its parent when it is the last child, which depth_first_search
+        # visits right after the parent, and shares its ell. The root itself never belongs to a path.
+        last = np.zeros(n, dtype=bool)
+        last[self.child_indices[self.child_offsets[1:][degrees > 0] - 1]] = True
+        extends = last & (self.ells == self.ells[self.parents]) & (self.parents != root)
+
+        # Every node jumps to the topmost node of its path, doubling the distance covered in each pass
+        head = np.where(extends, self.parents, np.arange(n, dtype=np.int64))
+        while True:
+            jump = head[head]
+            if np.array_equal(jump, head):
+                break
+            head = jump
+
+        heads = np.flatnonzero((head == np.arange(n)) & (self.parents >= 0))
+        heads = heads[np.argsort(self.pre[heads])]
+
+        # Tree.decompose assigns every node of a path the path's first node as its gpar, creating paths in
+        # pre-order. A node is thus left with itself as its gpar when paths hang off it.
+        self.gpars = self.parents[head]
+        self.gpars[self.parents[heads]] = self.parents[heads]
+
+        # Nodes are grouped by path, in the order the paths are created, and sorted by depth along each path
+        members = np.flatnonzero(self.parents >= 0)
+        members = members[np.lexsort((self.depths[members], self.pre[head[members]]))]
+        starts = np.flatnonzero(np.diff(np.concatenate(([-1], head[members]))) != 0)
+        self.path_nodes = np.insert(members, starts, self.parents[heads])
+        self.path_offsets = np.append(starts + np.arange(len(starts)), len(self.path_nodes))
+
+        self.path_index = np.full(n, -1, dtype=np.int64)
+        self.path_index[members] = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(members))))
+
+        curves = _Paths(self, embedded_nodes)
+        self.decomposition = curves
+
+        if lca_index:
+            start = default_timer()
+            self.__build_lca_index()
+            self.stats['lca_index_seconds'] = default_timer() - start
+            self.stats['lca_index_bytes'] = self.__pre_depths.nbytes + sum(level.nbytes for level in self.__sparse)
+
+        return curves
+
+    def lowest_common_ancestor(self, u, v):
+        if u == v:
+            return u
+
+        if self.__sparse is not None:
+            # The shallowest node after u and up to v in pre-order is a child of their LCA
+            i = int(min(self.pre[u.index], self.pre[v.index])) + 1
+            j = int(max(self.pre[u.index], self.pre[v.index])) + 1
+            k = (j - i).bit_length() - 1
+
+            a = self.__sparse[k][i]
+            b = self.__sparse[k][j - 2 ** k]
+            return self.node(self.parents[self.by_pre_order[a if self.__pre_depths[a] <= self.__pre_depths[b] else b]])
+
+        a, b = u.index, v.index
+        while self.depths[a] > self.depths[b]:
+            a = self.parents[a]
+        while self.depths[b] > self.depths[a]:
+            b = self.parents[b]
+        while a != b:
+            a, b = self.parents[a], self.parents[b]
+
+        return self.node(a)
+
+    def __euler_tour(self, root):
+        n = len(self.parents)
+        degrees = np.diff(self.child_offsets)
+        position = np.zeros(n, dtype=np.int64)
+        position[self.child_indices] = np.arange(n - 1)
+
+        # Arc v enters node v and arc n + v leaves it. depth_first_search visits children from last to
+        # first, so entering a node leads to its last child and leaving a node leads to its previous sibling.
+        succ = np.arange(2 * n, dtype=np.int64)
+        succ[:n] = np.where(degrees > 0, self.child_indices[np.maximum(self.child_offsets[1:] - 1, 0)],
+                            np.arange(n, 2 * n))
+
+        first = np.zeros(n, dtype=bool)
+        first[self.child_indices[self.child_offsets[:-1][degrees > 0]]] = True
+        succ[n:] = np.where(first, n + self.parents, self.child_indices[np.maximum(position - 1, 0)])
+        succ[n + root] = n + root
+
+        # Ranks every arc by its distance to the end of the tour, which leaves the root
+        rank = (succ != np.arange(2 * n)).astype(np.int64)
+        for _ in range((2 * n).bit_length()):
+            rank += rank[succ]
+            succ = succ[succ]
+
+        # Arcs on cycles unreachable from the root end up with ranks past the length of the tour
+        tour = np.full(2 * n, -1, dtype=np.int64)
+        valid = np.flatnonzero(rank < 2 * n)
+        tour[2 * n - 1 - rank[valid]] = valid
+        entered = np.zeros(2 * n + 1, dtype=np.int64)
+        np.cumsum((tour >= 0) & (tour < n), out=entered[1:])
+
+        # Between the arcs entering and leaving a node, the tour crosses every edge of its subtree twice
+        self.pre = entered[np.clip(2 * n - 1 - rank[:n], 0, 2 * n)]
+        self.counts = (rank[:n] - rank[n:] + 1) // 2
+        self.depths = 2 * self.pre - (2 * n - 1 - rank[:n])
+
+        self.by_pre_order = np.zeros(n, dtype=np.int64)
+        self.by_pre_order[self.pre[valid[valid < n]]] = valid[valid < n]
+
+    def __build_lca_index(self):
+        n = self.num_nodes()
+        dtype = np.int32 if n < 2 ** 31 else np.int64
+
+        # Level j holds, for every i, the pre-order position of the shallowest node in positions [i, i + 2 ** j)
+        self.__pre_depths = self.depths[self.by_pre_order]
+        self.__sparse = [np.arange(n, dtype=dtype)]
+        while 2 ** len(self.__sparse) <= n:
+            half = 2 ** (len(self.__sparse) - 1)
+            prev = self.__sparse[-1]
+            a = prev[:-half]
+            b = prev[half:]
+            self.__sparse.append(np.where(self.__pre_depths[a] <= self.__pre_depths[b], a, b))
+
+
+def _pre_order(root, children):
+    # The nodes below root in pre-order, with the children of every node in the order children lists
+    # them, along with the index of the parent of every node
+    nodes = list()
+    parents = list()
+    stack = [(root, -1)]
+    while len(stack) > 0:
+        node, parent = stack.pop()
+        index = len(nodes)
+        nodes.append(node)
+        parents.append(parent)
+
+        for child in reversed(children(node)):
+            stack.append((child, index))
+
+    return nodes, parents
+
+
+class _Paths(object):
+    """
+    The paths of a decomposed ArrayTree, see ArrayTree.decompose.
+    """
+
+    def __init__(self, tree, embedded_nodes):
+        self.tree = tree
+        self.embedded_nodes = embedded_nodes
+        self.coordinates = tree.coordinates[tree.path_nodes] if embedded_nodes else None
+
+        # Paths are built on first access and then kept, so that they can be told apart by identity
+        self.__paths = [None] * len(self)
+
+    def __len__(self):
+        return len(self.tree.path_offsets) - 1
+
+    def __getitem__(self, k):
+        if not -len(self) <= k < len(self):
+            raise IndexError('Path index out of range.')
+
+        k %= len(self)
+        if self.__paths[k] is None:
+            start, stop = self.tree.path_offsets[k:k + 2].tolist()
+            self.__paths[k] = ArrayCurve2D(self.coordinates, start, stop) if self.embedded_nodes else \
+                [self.tree.node(i) for i in self.tree.path_nodes[start:stop].tolist()]
+
+        return self.__paths[k]
+
+    def __iter__(self):
+        for k in range(0, len(self)):
+            yield self[k]
@@ -0,0 +1,39 @@
+import json
+import unittest
+
+import numpy as np
+
+from geometry.bench.benchmarks import BENCHMARKS, compare
+from geometry.bench.generators import curve_queries, linked_tree, random_walk, road_tree, spiral
+
+
+class TestBench(unittest.TestCase):
+
+    def test_generators_are_seeded(self):
+        assert np.array_equal(random_walk(50, seed=3).as_array(), random_walk(50, seed=3).as_array())
+        assert not np.array_equal(random_walk(50, seed=3).as_array(), random_walk(50, seed=4).as_array())
+        assert np.array_equal(spiral(11, jitter=0.0).as_array()[:3], [[0.0, 0.0], [5.0, 0.0], [5.0, 5.0]])
+
+        coordinates, parents = road_tree(200, seed=1)
+        tree = linked_tree(coordinates, parents)
+        assert len(list(tree.depth_first_search(tree.root))) == 200
+        assert np.all(parents[1:] < np.arange(1, 200))
+
+        q_edges, xs, ys, x_edges, y_edges = curve_queries(random_walk(20), 10, 1.0)
+        assert q_edges.shape == (10, 2, 2) and xs.shape == ys.shape == (10, 2)
+
+    def test_benchmarks_report_json(self):
+        results = list(BENCHMARKS['discrete_frechet']({'n': [10]}, 0, 1)) + \
+            list(BENCHMARKS['tree_decompose']({'n': [100]}, 0, 1))
+
+        assert len(results) == 4
+        for params, best, median, metrics in results:
+            assert 0 <= best <= median
+            json.dumps({'params': params, 'metrics': metrics})
+
+        baseline = [{'benchmark': 'a', 'params': {'n': 1}, 'seconds': 2.0}]
+        assert compare(baseline, [{'benchmark': 'a', 'params': {'n': 1}, 'seconds': 1.0}])[0][-1] == 0.5
+
+
+if __name__ == '__main__':
+    unittest.main()
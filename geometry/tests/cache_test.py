@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+
+from geometry.utils.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(max_bytes=3 * 80)
+        computed = list()
+
+        def compute(k):
+            def f():
+                computed.append(k)
+                return np.full(10, k, dtype=np.float64)
+            return f
+
+        for k in range(0, 3):
+            cache.get(k, compute(k))
+
+        # Touching 0 makes 1 the least recently used entry
+        assert cache.get(0, compute(0))[0] == 0
+        cache.get(3, compute(3))
+
+        assert len(cache) == 3 and cache.nbytes == 3 * 80
+        assert 1 not in cache and 0 in cache and 3 in cache
+        assert computed == [0, 1, 2, 3]
+        assert cache.hits == 1 and cache.misses == 4
+
+
+if __name__ == '__main__':
+    unittest.main()
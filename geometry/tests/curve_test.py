@@ -0,0 +1,92 @@
+import pickle
+import unittest
+import weakref
+
+import numpy as np
+from geometry.data_structures.curve import ArrayCurve2D, PolygonalCurve2D, Edge2D, sub_divide_array
+
+from geometry.data_structures.point import Point2D
+
+
+class TestArrayCurve(unittest.TestCase):
+
+    def setUp(self):
+        self.points = [
+            Point2D(0.0, 0.0),
+            Point2D(5.0, 0.0),
+            Point2D(5.0, 5.0),
+            Point2D(1.0, 5.0),
+            Point2D(1.0, 1.0),
+            Point2D(4.0, 1.0)
+        ]
+        self.curve = PolygonalCurve2D(self.points)
+        self.array_curve = ArrayCurve2D(self.curve.as_array())
+
+    def test_sub_curves_are_views(self):
+        left = self.array_curve.left_curve()
+        right = self.array_curve.right_curve()
+
+        assert left.coordinates is self.array_curve.coordinates
+        assert right.coordinates is self.array_curve.coordinates
+        assert np.shares_memory(left.as_array(), self.array_curve.as_array())
+
+        assert left.points == self.curve.left_curve().points
+        assert right.points == self.curve.right_curve().points
+        assert right.left_curve().points == self.curve.right_curve().left_curve().points
+        assert right.get_spine() == self.curve.right_curve().get_spine()
+
+    def test_contains(self):
+        assert self.array_curve.contains(Edge2D(Point2D(5.0, 5.0), Point2D(1.0, 5.0)))
+        assert not self.array_curve.contains(Edge2D(Point2D(1.0, 5.0), Point2D(5.0, 5.0)))
+        assert self.array_curve.is_in_right_curve(Edge2D(Point2D(1.0, 1.0), Point2D(4.0, 1.0)))
+        assert not self.array_curve.is_in_left_curve(Edge2D(Point2D(1.0, 1.0), Point2D(4.0, 1.0)))
+
+    def test_sub_divide(self):
+        for d_t in [0.3, 1.0, 1.5, 7.0]:
+            expected = sub_divide_array(self.curve.as_array(), d_t)
+
+            assert np.array_equal(self.curve.sub_divide(d_t), expected)
+            assert np.array_equal(self.array_curve.sub_divide(d_t), expected)
+            edge = Edge2D(*self.points[:2])
+            assert np.array_equal(edge.sub_divide(d_t), sub_divide_array(edge.as_array(), d_t))
+
+    def test_steiner_curves_are_shared(self):
+        steiner = self.array_curve.get_steiner_curve(0.3)
+        assert self.curve.get_steiner_curve(0.3) is self.curve.get_steiner_curve(0.3)
+
+        # Sub-curves take their Steiner points from the curve they were split from
+        for sub_curve in [self.array_curve.left_curve(), self.array_curve.right_curve().right_curve()]:
+            sub_steiner = sub_curve.get_steiner_curve(0.3)
+
+            assert sub_steiner.coordinates is steiner.coordinates
+            assert np.array_equal(sub_steiner.as_array(), sub_divide_array(sub_curve.as_array(), 0.3))
+
+    def test_steiner_curves_are_released(self):
+        # Steiner points are only kept while a curve taken from them is held
+        for curve in [self.curve, self.array_curve.right_curve()]:
+            steiner = curve.get_steiner_curve(0.3)
+            points = weakref.ref(steiner.coordinates)
+            del steiner
+
+            assert points() is None
+            assert np.array_equal(curve.get_steiner_curve(0.3).as_array(), sub_divide_array(curve.as_array(), 0.3))
+
+    def test_pickle_curve(self):
+        steiner = self.curve.get_steiner_curve(0.3)
+        curve = pickle.loads(pickle.dumps(self.curve))
+
+        assert curve.points == self.curve.points
+        assert np.array_equal(curve.get_steiner_curve(0.3).as_array(), steiner.as_array())
+
+    def test_partition_range(self):
+        edge = Edge2D(Point2D(0.0, 0.0), Point2D(10.0, 0.0))
+        pi = PolygonalCurve2D([Point2D(x, y) for x, y in sub_divide_array(edge.as_array(), 0.7).tolist()])
+
+        for x_i, delta in [(Point2D(3.0, 1.0), 2.0), (Point2D(0.0, 0.0), 1.5), (Point2D(9.0, -1.0), 3.0),
+                           (Point2D(5.0, 4.0), 2.0), (Point2D(2.8, 1.0), 1.0)]:
+            start, stop = edge.partition_range(0.7, x_i, delta)
+            assert pi.points[start:stop] == Edge2D.partition(pi.points, x_i, delta)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,15 @@
+import os
+import shutil
+import tempfile
 import unittest
+import weakref
 
-from geometry.data_structures.curve import PolygonalCurve2D, Edge2D
+import numpy as np
+
+from geometry import STEINER_SPACING
+from geometry.algorithms.frechet_distance import continuous_frechet_segments
+from geometry.data_structures import curve as curve_module
+from geometry.data_structures.curve import ArrayCurve2D, PolygonalCurve2D, Edge2D
 from geometry.data_structures.curve_range_tree import CurveRangeTree2D
 
 from geometry.data_structures.point import Point2D
@@ -22,7 +31,28 @@ class TestCurveRangeTree(unittest.TestCase):
             , self.error, self.delta)
 
         # Create query parameters
+        q_edge = Edge2D(Point2D(0.0, -1.0), Point2D(3.5, 1.5))
+        x = Point2D(0.25, 0.0)
+        x_edge = Edge2D(Point2D(0.0, 0.0), Point2D(3.0, 0.0))
+        y = Point2D(3.0, 2.5)
+        y_edge = Edge2D(Point2D(3.0, 0.0), Point2D(3.0, 3.0))
+
+        assert tree.is_approximate(q_edge, x, y, x_edge, y_edge)
+
+        # The end of q_edge lies 3.5 away from y, further than (1 + error) * delta
         q_edge = Edge2D(Point2D(0.0, -1.0), Point2D(3.0, -1.0))
+        assert not tree.is_approximate(q_edge, x, y, x_edge, y_edge)
+
+    def test_query_array_curve(self):
+        tree = CurveRangeTree2D(
+            ArrayCurve2D([
+                [0.0, 0.0],
+                [3.0, 0.0],
+                [3.0, 3.0]
+            ])
+            , self.error, self.delta)
+
+        q_edge = Edge2D(Point2D(0.0, -1.0), Point2D(3.5, 1.5))
         x = Point2D(0.25, 0.0)
         x_edge = Edge2D(Point2D(0.0, 0.0), Point2D(3.0, 0.0))
         y = Point2D(3.0, 2.5)
@@ -30,6 +60,10 @@ class TestCurveRangeTree(unittest.TestCase):
 
         assert tree.is_approximate(q_edge, x, y, x_edge, y_edge)
 
+        # The end of q_edge lies 3.5 away from y, further than (1 + error) * delta
+        q_edge = Edge2D(Point2D(0.0, -1.0), Point2D(3.0, -1.0))
+        assert not tree.is_approximate(q_edge, x, y, x_edge, y_edge)
+
     def test_query_square_curve(self):
         tree = CurveRangeTree2D(
             PolygonalCurve2D([
@@ -54,8 +88,9 @@ class TestCurveRangeTree(unittest.TestCase):
         y_edge = Edge2D(Point2D(3.0, 2.0), Point2D(3.0, 3.0))
 
         # Query various edges against this tree
+        # P[x, y] winds around the whole square, much further than (1 + error) * delta from q_edge
         q_edge = Edge2D(Point2D(2.5, -2.0), Point2D(5.5, -0.5))
-        assert tree.is_approximate(q_edge, x, y, x_edge, y_edge)
+        assert not tree.is_approximate(q_edge, x, y, x_edge, y_edge)
 
         q_edge = Edge2D(Point2D(-1.1, 5.0), Point2D(-1.1, 1))
         assert not tree.is_approximate(q_edge, x, y, x_edge, y_edge)
@@ -66,6 +101,339 @@ class TestCurveRangeTree(unittest.TestCase):
         q_edge = Edge2D(Point2D(0.0, 0.0), Point2D(5.0, 5.0))
         assert not tree.is_approximate(q_edge, x, y, x_edge, y_edge)
 
+    def test_continuous_engine(self):
+        curve = PolygonalCurve2D([
+            Point2D(0.0, 0.0),
+            Point2D(5.0, 0.0),
+            Point2D(5.0, 5.0),
+            Point2D(1.0, 5.0),
+            Point2D(1.0, 1.0),
+            Point2D(4.0, 1.0),
+            Point2D(4.0, 4.0)
+        ])
+        tree = CurveRangeTree2D(curve, self.error, self.delta, engine='continuous')
+        discrete_tree = CurveRangeTree2D(curve, self.error, self.delta)
+
+        x = Point2D(2.5, 0.0)
+        x_edge = Edge2D(Point2D(0.0, 0.0), Point2D(5.0, 0.0))
+        y = Point2D(4.0, 2.5)
+        y_edge = Edge2D(Point2D(4.0, 1.0), Point2D(4.0, 4.0))
+
+        for q_edge in [Edge2D(Point2D(2.5, -2.0), Point2D(5.5, -0.5)),
+                       Edge2D(Point2D(-1.1, 5.0), Point2D(-1.1, 1)),
+                       Edge2D(Point2D(0.0, 0.0), Point2D(5.0, 5.0))]:
+            assert tree.is_approximate(q_edge, x, y, x_edge, y_edge) == \
+                discrete_tree.is_approximate(q_edge, x, y, x_edge, y_edge)
+
+    def test_parallel_build(self):
+        curve = ArrayCurve2D([
+            [0.0, 0.0],
+            [5.0, 0.0],
+            [5.0, 5.0],
+            [1.0, 5.0],
+            [1.0, 1.0],
+            [4.0, 1.0],
+            [4.0, 4.0]
+        ])
+        serial = CurveRangeTree2D(curve, self.error, self.delta)
+        parallel = CurveRangeTree2D(curve, self.error, self.delta, workers=2)
+
+        serial_nodes = list(serial.post_order_traversal(serial.root))
+        parallel_nodes = list(parallel.post_order_traversal(parallel.root))
+        assert len(serial_nodes) == len(parallel_nodes)
+
+        for a, b in zip(serial_nodes, parallel_nodes):
+            assert a.curve.points == b.curve.points
+            assert a.grid.spine_distance == b.grid.spine_distance
+            assert np.array_equal(a.grid.distances, b.grid.distances)
+
+        # The Steiner points shared during the build are not kept by the finished tree
+        points = weakref.ref(serial.root.curve.get_steiner_curve(STEINER_SPACING).coordinates)
+        assert points() is None
+
+    def test_steiner_points_per_build(self):
+        coordinates = [[0.0, 0.0], [5.0, 0.0], [5.0, 5.0], [1.0, 5.0], [1.0, 1.0], [4.0, 1.0], [4.0, 4.0]]
+        sub_divide = curve_module._sub_divide
+        calls = list()
+
+        def counted(*args):
+            calls.append(args)
+            return sub_divide(*args)
+
+        curve_module._sub_divide = counted
+        try:
+            # Every grid places the Steiner points of its own subpath once
+            tree = CurveRangeTree2D(PolygonalCurve2D([Point2D(x, y) for x, y in coordinates]), self.error, self.delta)
+            assert len(calls) == len(list(tree.post_order_traversal(tree.root)))
+
+            # Subpaths of an ArrayCurve2D share the Steiner points of the whole curve
+            del calls[:]
+            CurveRangeTree2D(ArrayCurve2D(coordinates), self.error, self.delta)
+            assert len(calls) == 1
+        finally:
+            curve_module._sub_divide = sub_divide
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'tree.bin')
+
+        curve = PolygonalCurve2D([
+            Point2D(0.0, 0.0),
+            Point2D(5.0, 0.0),
+            Point2D(5.0, 5.0),
+            Point2D(1.0, 5.0),
+            Point2D(1.0, 1.0)
+        ])
+        tree = CurveRangeTree2D(curve, self.error, self.delta)
+
+        try:
+            tree.save(path)
+            loaded = CurveRangeTree2D.load(path)
+
+            for a, b in zip(tree.post_order_traversal(tree.root), loaded.post_order_traversal(loaded.root)):
+                assert a.curve.points == b.curve.points
+                assert np.array_equal(a.grid.distances, b.grid.distances)
+
+            x = Point2D(2.5, 0.0)
+            x_edge = Edge2D(Point2D(0.0, 0.0), Point2D(5.0, 0.0))
+            y = Point2D(1.0, 2.5)
+            y_edge = Edge2D(Point2D(1.0, 5.0), Point2D(1.0, 1.0))
+            q_edge = Edge2D(Point2D(2.5, -2.0), Point2D(5.5, -0.5))
+
+            assert tree.is_approximate(q_edge, x, y, x_edge, y_edge) == \
+                loaded.is_approximate(q_edge, x, y, x_edge, y_edge)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_query_many(self):
+        tree = CurveRangeTree2D(
+            PolygonalCurve2D([
+                Point2D(0.0, 0.0),
+                Point2D(5.0, 0.0),
+                Point2D(5.0, 5.0),
+                Point2D(1.0, 5.0),
+                Point2D(1.0, 1.0),
+                Point2D(4.0, 1.0),
+                Point2D(4.0, 4.0)
+            ])
+            , self.error, self.delta)
+
+        q_edges = [
+            [[2.5, -2.0], [5.5, -0.5]],
+            [[-1.1, 5.0], [-1.1, 1.0]],
+            [[1.0, 2.5], [5.0, 2.5]],
+            [[0.0, 0.0], [5.0, 5.0]],
+            [[5.5, 0.5], [5.5, 4.5]]
+        ]
+        xs = [[2.5, 0.0], [2.5, 0.0], [2.5, 0.0], [1.0, 0.0], [5.0, 0.5]]
+        ys = [[4.0, 2.5], [4.0, 2.5], [4.0, 3.0], [4.0, 2.5], [4.5, 5.0]]
+        x_edges = [[[0.0, 0.0], [5.0, 0.0]]] * 4 + [[[5.0, 0.0], [5.0, 5.0]]]
+        y_edges = [[[4.0, 1.0], [4.0, 4.0]]] * 4 + [[[5.0, 5.0], [1.0, 5.0]]]
+
+        answers = tree.is_approximate_many(q_edges, xs, ys, x_edges, y_edges)
+
+        assert answers.dtype == bool and len(answers) == len(q_edges)
+        for k in range(0, len(q_edges)):
+            def edge(e):
+                return Edge2D(Point2D(*e[0]), Point2D(*e[1]))
+
+            assert answers[k] == tree.is_approximate(
+                edge(q_edges[k]), Point2D(*xs[k]), Point2D(*ys[k]), edge(x_edges[k]), edge(y_edges[k]))
+
+    def test_query_many_groups(self):
+        coordinates = np.array([[i, i % 2] for i in range(0, 13)], dtype=np.float64)
+        tree = CurveRangeTree2D(ArrayCurve2D(coordinates), self.error, self.delta)
+        rng = np.random.RandomState(1)
+
+        # Queries over every pair of edges, a few of them sharing their (x_edge, y_edge) group
+        i, j = np.array([sorted(rng.choice(12, 2, replace=False)) for _ in range(0, 60)]).T
+        i[40:], j[40:] = i[:20], j[:20]
+        xs = (coordinates[i] + coordinates[i + 1]) / 2
+        ys = (coordinates[j] + coordinates[j + 1]) / 2
+        q_edges = np.stack((xs, ys), axis=1) + rng.uniform(-1.5, 1.5, (60, 2, 2))
+        x_edges = np.stack((coordinates[i], coordinates[i + 1]), axis=1)
+        y_edges = np.stack((coordinates[j], coordinates[j + 1]), axis=1)
+
+        answers = tree.is_approximate_many(q_edges, xs, ys, x_edges, y_edges)
+
+        def edge(e):
+            return Edge2D(Point2D(*e[0]), Point2D(*e[1]))
+
+        assert any(answers) and not all(answers)
+        for k in range(0, 60):
+            assert answers[k] == tree.is_approximate(
+                edge(q_edges[k]), Point2D(*xs[k]), Point2D(*ys[k]), edge(x_edges[k]), edge(y_edges[k]))
+
+    def test_lazy_build(self):
+        curve = PolygonalCurve2D([
+            Point2D(0.0, 0.0),
+            Point2D(5.0, 0.0),
+            Point2D(5.0, 5.0),
+            Point2D(1.0, 5.0),
+            Point2D(1.0, 1.0),
+            Point2D(4.0, 1.0),
+            Point2D(4.0, 4.0)
+        ])
+        tree = CurveRangeTree2D(curve, self.error, self.delta)
+        lazy = CurveRangeTree2D(curve, self.error, self.delta, lazy=True)
+
+        assert all(node.grid.distances is None for node in lazy.post_order_traversal(lazy.root))
+
+        x = Point2D(2.5, 0.0)
+        x_edge = Edge2D(Point2D(0.0, 0.0), Point2D(5.0, 0.0))
+        y = Point2D(4.0, 2.5)
+        y_edge = Edge2D(Point2D(4.0, 1.0), Point2D(4.0, 4.0))
+
+        for q_edge in [Edge2D(Point2D(2.5, -2.0), Point2D(5.5, -0.5)),
+                       Edge2D(Point2D(-1.1, 5.0), Point2D(-1.1, 1)),
+                       Edge2D(Point2D(0.0, 0.0), Point2D(5.0, 5.0))]:
+            assert tree.is_approximate(q_edge, x, y, x_edge, y_edge) == \
+                lazy.is_approximate(q_edge, x, y, x_edge, y_edge)
+
+    def test_partition_path(self):
+        coordinates = np.array([[i, i % 2] for i in range(0, 13)], dtype=np.float64)
+        tree = CurveRangeTree2D(ArrayCurve2D(coordinates), self.error, self.delta)
+
+        def edge(i):
+            return Edge2D(Point2D(*coordinates[i]), Point2D(*coordinates[i + 1]))
+
+        for i in range(0, 11):
+            for j in range(i + 1, 12):
+                x = Point2D(i + 0.5, 0.5)
+                y = Point2D(j + 0.5, 0.5)
+                subpaths = tree.partition_path(x, y, edge(i), edge(j))
+
+                # The subpaths strictly between the partial edges at x and y cover P[i + 1, j]
+                inner = subpaths[1:-1]
+                assert subpaths[0].curve.get_spine() == (x, Point2D(*coordinates[i + 1]))
+                assert subpaths[-1].curve.get_spine() == (Point2D(*coordinates[j]), y)
+                covered = i + 1
+                for node in inner:
+                    assert node.start == covered
+                    covered = node.stop - 1
+
+                assert covered == j
+
+    def test_decision_mode(self):
+        coordinates = np.array([[i, i % 2] for i in range(0, 13)], dtype=np.float64)
+        tree = CurveRangeTree2D(ArrayCurve2D(coordinates), self.error, self.delta)
+        rng = np.random.RandomState(0)
+
+        def edge(i):
+            return Edge2D(Point2D(*coordinates[i]), Point2D(*coordinates[i + 1]))
+
+        answers = list()
+        for _ in range(0, 40):
+            i, j = sorted(rng.choice(12, 2, replace=False))
+            x = Point2D(i + 0.5, 0.5)
+            y = Point2D(j + 0.5, 0.5)
+            (p1_x, p1_y), (p2_x, p2_y) = [[x.x, x.y], [y.x, y.y]] + rng.uniform(-2, 2, (2, 2))
+            q_edge = Edge2D(Point2D(p1_x, p1_y), Point2D(p2_x, p2_y))
+            subpaths = tree.partition_path(x, y, edge(i), edge(j))
+
+            # Deciding agrees with comparing the weight of the bottleneck path against (1 + error) * delta
+            answers.append(tree.find_frechet_bottleneck(q_edge, subpaths))
+
+            # The prefilter only resolves the queries whose Frechet distance is sure to lie outside of those bounds
+            answer = tree.prefilter(q_edge, subpaths)
+            path = np.concatenate(([[x.x, x.y]], coordinates[i + 1:j + 1], [[y.x, y.y]]))
+            distance = continuous_frechet_segments([[p1_x, p1_y]], [[p2_x, p2_y]], path)[0]
+            assert answer is None or \
+                (distance <= self.delta if answer else distance > (1 + self.error) * self.delta)
+            assert answers[-1] == (tree.frechet_bottleneck_weight(q_edge, subpaths) <= (1 + self.error) * self.delta)
+
+        assert any(answers) and not all(answers)
+
+    def test_dag_edges_move_forward(self):
+        coordinates = np.array([[0.1 * i, 0.0] for i in range(0, 6)])
+        tree = CurveRangeTree2D(ArrayCurve2D(coordinates), self.error, self.delta)
+
+        def edge(i):
+            return Edge2D(Point2D(*coordinates[i]), Point2D(*coordinates[i + 1]))
+
+        # q_edge is shorter than the Steiner spacing, so every partition only holds its two endpoints
+        q_edge = Edge2D(Point2D(0.1, 0.5), Point2D(0.2, 0.5))
+        subpaths = tree.partition_path(Point2D(0.05, 0.0), Point2D(0.45, 0.0), edge(0), edge(4))
+        assert len(subpaths) > 3
+
+        # A path may not stay at the same point of q_edge from one layer to the next
+        assert tree.frechet_bottleneck_weight(q_edge, subpaths) == float('inf')
+        assert not tree.find_frechet_bottleneck(q_edge, subpaths)
+
+    def test_dag_matches_endpoints(self):
+        tree = CurveRangeTree2D(
+            PolygonalCurve2D([
+                Point2D(0.0, 0.0),
+                Point2D(3.0, 0.0),
+                Point2D(3.0, 3.0)
+            ])
+            , self.error, self.delta)
+
+        x = Point2D(0.25, 0.0)
+        y = Point2D(3.0, 2.5)
+        subpaths = tree.partition_path(x, y, Edge2D(Point2D(0.0, 0.0), Point2D(3.0, 0.0)),
+                                       Edge2D(Point2D(3.0, 0.0), Point2D(3.0, 3.0)))
+
+        # The end of q_edge lies 3.5 away from y, which the last layer of the DAG weighs on its own
+        q_edge = Edge2D(Point2D(0.0, -1.0), Point2D(3.0, -1.0))
+        assert tree.frechet_bottleneck_weight(q_edge, subpaths) == 3.5
+        assert not tree.find_frechet_bottleneck(q_edge, subpaths)
+
+    def test_prefilter(self):
+        def edge(p, q):
+            return Edge2D(Point2D(*p), Point2D(*q))
+
+        def resolve(tree, queries):
+            # Answers of the prefilter, which is_approximate and is_approximate_many give as well when resolved
+            answers = list()
+            for q_edge, x, y, x_edge, y_edge in queries:
+                answer = tree.prefilter(q_edge, tree.partition_path(x, y, x_edge, y_edge))
+                if answer is not None:
+                    assert tree.is_approximate(q_edge, x, y, x_edge, y_edge) == answer
+                answers.append(answer)
+
+            many = tree.is_approximate_many(
+                [[[q.p1.x, q.p1.y], [q.p2.x, q.p2.y]] for q, _, _, _, _ in queries],
+                [[x.x, x.y] for _, x, _, _, _ in queries],
+                [[y.x, y.y] for _, _, y, _, _ in queries],
+                [[[e.p1.x, e.p1.y], [e.p2.x, e.p2.y]] for _, _, _, e, _ in queries],
+                [[[e.p1.x, e.p1.y], [e.p2.x, e.p2.y]] for _, _, _, _, e in queries]
+            )
+            assert all(a is None or a == b for a, b in zip(answers, many.tolist()))
+            return answers
+
+        tree = CurveRangeTree2D(PolygonalCurve2D([Point2D(float(i), 0.0) for i in range(0, 4)]), self.error, self.delta)
+        x, y = Point2D(0.5, 0.0), Point2D(2.5, 0.0)
+        x_edge, y_edge = edge((0.0, 0.0), (1.0, 0.0)), edge((2.0, 0.0), (3.0, 0.0))
+        assert resolve(tree, [
+            # The start of q_edge lies 2.5 away from x, further than (1 + error) * delta
+            (edge((0.5, 2.5), (2.5, 0.0)), x, y, x_edge, y_edge),
+            # P[x, y] runs within 0.5 of q_edge, point by point, and is accepted
+            (edge((0.5, 0.5), (2.5, 0.5)), x, y, x_edge, y_edge),
+            # P[x, y] runs 1.5 away from q_edge, so neither bound settles the query
+            (edge((0.5, 1.5), (2.5, 1.5)), x, y, x_edge, y_edge)
+        ]) == [False, True, None]
+
+        # The subpath starting at the corner (4, 0) lies 2.76 away from q_edge, although its box does not
+        tree = CurveRangeTree2D(
+            PolygonalCurve2D([Point2D(0.0, 0.0), Point2D(4.0, 0.0), Point2D(4.0, 4.0), Point2D(4.0, 5.0)]),
+            self.error, self.delta)
+        assert resolve(tree, [
+            (edge((0.5, 0.0), (4.0, 4.5)), Point2D(0.5, 0.0), Point2D(4.0, 4.5),
+             edge((0.0, 0.0), (4.0, 0.0)), edge((4.0, 4.0), (4.0, 5.0)))
+        ]) == [False]
+
+        # The spike at (3, 5) lies inside the subpath from (2, 0) to (4, 0), of which only the box reaches it
+        points = [Point2D(float(i), 5.0 if i == 3 else 0.0) for i in range(0, 9)]
+        tree = CurveRangeTree2D(PolygonalCurve2D(points), self.error, self.delta)
+        subpaths = tree.partition_path(Point2D(0.5, 0.0), Point2D(7.5, 0.0), edge((0.0, 0.0), (1.0, 0.0)),
+                                       edge((7.0, 0.0), (8.0, 0.0)))
+        assert all(node.spine[0][1] == 0 for node in subpaths)
+        assert resolve(tree, [
+            (edge((0.5, 0.0), (7.5, 0.0)), Point2D(0.5, 0.0), Point2D(7.5, 0.0),
+             edge((0.0, 0.0), (1.0, 0.0)), edge((7.0, 0.0), (8.0, 0.0)))
+        ]) == [False]
+
     def test_small_float_values(self):
         tree = CurveRangeTree2D(
             PolygonalCurve2D([
@@ -1,6 +1,8 @@
 import unittest
 
-from geometry.data_structures.graph import DirectedAcyclicGraph
+import numpy as np
+
+from geometry.data_structures.graph import DirectedAcyclicGraph, LayeredGraph, bottleneck_layers
 from geometry.data_structures.point import Point2D
 
 
@@ -37,3 +39,65 @@ class TestCurveRangeTree(unittest.TestCase):
         dag.add_edge(p6, p4, 6)
 
         assert dag.bottleneck_path_weight(p1, p4) == 2
+
+    def test_bottleneck_path_witness(self):
+        dag = DirectedAcyclicGraph()
+
+        p1 = Point2D(0, 0)
+        p2 = Point2D(1, 0)
+        p3 = Point2D(2, 0)
+        p4 = Point2D(3, 0)
+        p5 = Point2D(1, -1)
+
+        dag.add_edge(p1, p2, 1)
+        dag.add_edge(p2, p3, 4)
+        dag.add_edge(p3, p4, 1)
+        dag.add_edge(p1, p5, 2)
+        dag.add_edge(p5, p3, 3)
+
+        assert dag.bottleneck_path(p1, p4) == (3, [p1, p5, p3, p4])
+
+    def test_bottleneck_unreachable_end(self):
+        dag = DirectedAcyclicGraph()
+
+        p1 = Point2D(0, 0)
+        p2 = Point2D(1, 0)
+        p3 = Point2D(2, 0)
+        p4 = Point2D(1, -1)
+
+        # The light edge leads to a dead end and does not count as a path to p3
+        dag.add_edge(p1, p2, 1)
+        dag.add_edge(p1, p4, 2)
+        dag.add_edge(p4, p3, 5)
+
+        assert dag.bottleneck_path_weight(p1, p3) == 5
+        assert dag.bottleneck_path(p3, p1) == (float('inf'), [])
+
+    def test_bottleneck_many_layers(self):
+        rng = np.random.RandomState(0)
+        layers = [1] + [5] * 50 + [1]
+        weights = [rng.uniform(0, 10, (layers[k], layers[k + 1])) for k in range(0, len(layers) - 1)]
+        weights[10][rng.uniform(size=weights[10].shape) < 0.5] = np.inf
+
+        dag = DirectedAcyclicGraph()
+        for k, w in enumerate(weights):
+            for i in range(0, w.shape[0]):
+                for j in range(0, w.shape[1]):
+                    if np.isfinite(w[i, j]):
+                        dag.add_edge(Point2D(k, i), Point2D(k + 1, j), w[i, j])
+
+        weight, path = bottleneck_layers(weights)
+        assert weight == dag.bottleneck_path_weight(Point2D(0, 0), Point2D(len(weights), 0))
+        assert len(path) == len(layers)
+        assert weight == max(weights[k][path[k], path[k + 1]] for k in range(0, len(weights)))
+
+    def test_layered_graph(self):
+        dag = LayeredGraph([1, 2, 2, 1])
+
+        dag.add_edges(0, [0, 0], [0, 1], [1, 2])
+        dag.add_edges(1, [0, 1, 1], [0, 0, 1], [4, 3, 5])
+        dag.add_edges(2, [0, 1], [0, 0], [1, 0])
+
+        assert dag.num_vertices() == 6
+        assert dag.num_edges() == 7
+        assert dag.bottleneck_path() == (3, [0, 2, 3, 5])
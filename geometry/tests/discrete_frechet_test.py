@@ -2,9 +2,10 @@ import unittest
 from random import randint
 
 import numpy as np
-from geometry.data_structures.curve import PolygonalCurve2D, Edge2D
+from geometry.data_structures.curve import PolygonalCurve2D, Edge2D, sub_divide_array
 
-from geometry.algorithms.frechet_distance import discrete_frechet
+from geometry.algorithms.frechet_distance import continuous_frechet_segments, discrete_frechet, discrete_frechet_array, \
+    discrete_frechet_segments
 from geometry.data_structures.point import Point2D
 
 
@@ -41,6 +42,60 @@ class TestDiscreteFrechet(unittest.TestCase):
 
         self.perform_test(c1, c2, 6.08)
 
+    def test_long_curves(self):
+        # Deep enough to exceed the interpreter's recursion limit with a recursive DP
+        c1 = PolygonalCurve2D([Point2D(float(i), 0.0) for i in range(0, 3000)])
+        c2 = PolygonalCurve2D([Point2D(float(i), 2.0) for i in range(0, 2000)])
+
+        self.perform_test(c1, c2, 1000.0)
+        self.perform_test(c2, c1, 1000.0)
+
+    def test_array_input(self):
+        c1 = np.array([[-5.0, 1.0], [-4.0, 4.0], [-2.0, -1.0]])
+        c2 = np.array([[-6.0, 0.0], [-3.0, -2.0], [-2.0, 1.0]])
+
+        assert round(discrete_frechet_array(c1, c2), 2) == 6.08
+
+    def test_segments_batch(self):
+        spacing = 0.5
+        curve = PolygonalCurve2D([
+            Point2D(-5.0, 1.0),
+            Point2D(-4.0, 4.0),
+            Point2D(-2.0, -1.0)
+        ]).get_steiner_curve(spacing).as_array()
+
+        starts = np.array([[0.0, 0.0], [-6.0, 0.0], [-5.0, 1.0], [3.0, 3.0]])
+        ends = np.array([[1.0, 7.0], [-2.0, 1.0], [-2.0, -1.0], [3.0, 3.0]])
+
+        # A small cell budget forces the segments to be split over several chunks
+        distances = discrete_frechet_segments(starts, ends, curve, spacing, max_cells=20)
+
+        for k in range(0, len(starts)):
+            segment = sub_divide_array(np.array([starts[k], ends[k]]), spacing)
+            assert abs(distances[k] - discrete_frechet_array(segment, curve)) < 1e-9
+
+    def test_continuous_segments(self):
+        curve = np.array([[0.0, 0.0], [4.0, 0.0], [1.0, 1.0], [5.0, 1.0]])
+        starts = np.array([[0.0, 0.5], [0.0, 0.0], [0.0, 0.0], [2.0, 2.0]])
+        ends = np.array([[5.0, 0.5], [5.0, 1.0], [0.0, 0.0], [2.0, 2.0]])
+
+        distances = continuous_frechet_segments(starts, ends, curve)
+
+        # Backtracking from (4, 0) to (1, 1) forces the segment to wait halfway between them
+        assert abs(distances[0] - np.hypot(1.5, 0.5)) < 1e-9
+
+        # Degenerate segments are as far as the furthest vertex
+        assert abs(distances[2] - np.hypot(5.0, 1.0)) < 1e-9
+        assert abs(distances[3] - np.hypot(3.0, 1.0)) < 1e-9
+
+        # The continuous distance never exceeds a fine discrete approximation
+        for k in range(0, len(starts)):
+            segment = sub_divide_array(np.array([starts[k], ends[k]]), 0.01)
+            dense = sub_divide_array(curve, 0.01)
+            discrete = discrete_frechet_array(np.vstack((segment[:1], segment)), np.vstack((dense[:1], dense)))
+            assert distances[k] <= discrete + 1e-9
+            assert discrete - distances[k] < 0.02
+
     @staticmethod
     def perform_test(c1, c2, dist):
         frechet = discrete_frechet(c1, c2)
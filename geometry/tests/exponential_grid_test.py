@@ -21,3 +21,50 @@ class TestExponentialGrid(unittest.TestCase):
         # Test for error property
         assert np.linalg.norm(p.v - p_prime.v) <= \
             (self.error / 2) * np.linalg.norm(p.v - u.v)
+
+    def test_integer_indices(self):
+        u = Point2D(0.0, 0.0)
+        grid = ExponentialGrid2D(u, self.error, 1.0, 20.0)
+        p = Point2D(3.0, -7.5)
+        i = grid.approximate_index(p)
+
+        assert grid.points[i] == grid.approximate_point(p)
+        assert grid.coordinates.shape == (len(grid.points), 2)
+        assert grid.coordinates[i][0] == grid.points[i].x and grid.coordinates[i][1] == grid.points[i].y
+        assert len(set(grid.points)) == len(grid.points)
+
+    def test_batch_approximation(self):
+        u = Point2D(3.0, -2.0)
+        grid = ExponentialGrid2D(u, self.error, 1.0, 20.0)
+
+        angles = np.linspace(0, 2 * np.pi, 50)
+        radii = np.linspace(1.0, 20.0, 50)
+        points = np.stack((u.x + radii * np.cos(angles), u.y + radii * np.sin(angles)), axis=1)
+        approximations = grid.approximate_points(points)
+
+        # Test for error property of every point in the batch
+        assert np.all(np.hypot(*(points - approximations).T) <= (self.error / 2) * radii)
+        assert np.array_equal(approximations[7], grid.coordinates[grid.approximate_index(Point2D(*points[7]))])
+
+    def test_shared_template(self):
+        grid = ExponentialGrid2D(Point2D(0.0, 0.0), self.error, 1.0, 20.0)
+        other = ExponentialGrid2D(Point2D(4.0, -1.0), self.error, 3.0, 60.0)
+
+        # Grids of the same error and ratio beta / alpha are translated and scaled copies of each other
+        assert len(grid) == len(other)
+        assert np.allclose(other.coordinates, [4.0, -1.0] + 3.0 * grid.coordinates)
+
+        p = Point2D(2.0, 5.0)
+        assert grid.approximate_index(p) == other.approximate_index(Point2D(4.0 + 3.0 * p.x, -1.0 + 3.0 * p.y))
+
+    def test_outside_of_grid(self):
+        grid = ExponentialGrid2D(Point2D(0.0, 0.0), 0.5, 1.0, 4.0)
+
+        # The top level covers the square of half side 4 around the center, so beta is covered
+        p = Point2D(3.9, 0.0)
+        assert np.linalg.norm(p.v - grid.approximate_point(p).v) <= (0.5 / 2) * np.linalg.norm(p.v)
+
+        with self.assertRaises(AssertionError):
+            grid.approximate_point(Point2D(7.9, 0.0))
+        with self.assertRaises(AssertionError):
+            grid.approximate_points([[0.0, 2.0], [-4.5, 1.0]])
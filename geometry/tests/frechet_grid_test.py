@@ -1,11 +1,15 @@
 import unittest
 
-from geometry.data_structures.curve import PolygonalCurve2D, Edge2D
+import numpy as np
+
+from geometry.data_structures.curve import PolygonalCurve2D, Edge2D, sub_divide_array
 from geometry.data_structures.point import Point2D
 
 from geometry import STEINER_SPACING
-from geometry.algorithms.frechet_distance import discrete_frechet
-from geometry.data_structures.frechet_grid import FrechetGrid2D
+from geometry.algorithms.frechet_distance import continuous_frechet_segments, discrete_frechet
+from geometry.data_structures import frechet_grid
+from geometry.data_structures.frechet_grid import FrechetGrid2D, SegmentFrechetGrid2D
+from geometry.utils.cache import TABLE_CACHE
 
 
 class TestFrechetGrid(unittest.TestCase):
@@ -47,3 +51,102 @@ class TestFrechetGrid(unittest.TestCase):
         # Test for (1 + epsilon) property of grid estimate
         assert estimate <= real or \
             real <= (1 + self.error) * estimate
+
+    def test_single_precision_table(self):
+        curve = PolygonalCurve2D([
+            Point2D(-5.0, 1.0),
+            Point2D(-4.0, 4.0),
+            Point2D(-2.0, -1.0)
+        ])
+        e = Edge2D(Point2D(-5.0, 3.5), Point2D(-2.0, -3.5))
+        grid = FrechetGrid2D(curve, self.error)
+        grid32 = FrechetGrid2D(curve, self.error, dtype=np.float32)
+
+        assert grid.distances.shape == (len(grid.grid_u.points), len(grid.grid_v.points))
+        assert grid32.distances.dtype == np.float32
+        assert abs(grid.approximate_frechet(e) - grid32.approximate_frechet(e)) < 1e-4
+
+    def test_continuous_engine(self):
+        curve = PolygonalCurve2D([
+            Point2D(-5.0, 1.0),
+            Point2D(-4.0, 4.0),
+            Point2D(-2.0, -1.0)
+        ])
+        e = Edge2D(Point2D(-5.0, 3.5), Point2D(-2.0, -3.5))
+        grid = FrechetGrid2D(curve, self.error, engine='continuous')
+
+        real = continuous_frechet_segments([[e.p1.x, e.p1.y]], [[e.p2.x, e.p2.y]], curve.as_array())[0]
+        estimate = grid.approximate_frechet(e)
+
+        # Test for (1 + epsilon) property of grid estimate
+        assert estimate <= real or \
+            real <= (1 + self.error) * estimate
+
+    def test_approximate_many(self):
+        curve = PolygonalCurve2D([
+            Point2D(-5.0, 1.0),
+            Point2D(-4.0, 4.0),
+            Point2D(-2.0, -1.0)
+        ])
+        grid = FrechetGrid2D(curve, self.error)
+        starts = np.array([[-5.0, 3.5], [-5.0, 1.0], [-20.0, -22.0], [-4.0, 2.0]])
+        ends = np.array([[-2.0, -3.5], [-2.0, -1.0], [5.0, 5.0], [-1.0, -2.0]])
+
+        estimates = grid.approximate_frechet_many(starts, ends)
+
+        for k in range(0, len(starts)):
+            e = Edge2D(Point2D(*starts[k]), Point2D(*ends[k]))
+            assert abs(estimates[k] - grid.approximate_frechet(e)) < 1e-12
+
+    def test_lazy_grid(self):
+        curve = PolygonalCurve2D([
+            Point2D(-5.0, 1.0),
+            Point2D(-4.0, 4.0),
+            Point2D(-2.0, -1.0)
+        ])
+        grid = FrechetGrid2D(curve, self.error)
+        lazy = FrechetGrid2D(curve, self.error, lazy=True)
+
+        assert lazy.distances is None and lazy.grid_u is None
+        TABLE_CACHE.clear()
+        starts = np.array([[-5.0, 3.5], [-5.0, 1.0], [-20.0, -22.0], [-4.0, 2.0]])
+        ends = np.array([[-2.0, -3.5], [-2.0, -1.0], [5.0, 5.0], [-1.0, -2.0]])
+
+        assert np.allclose(lazy.approximate_frechet_many(starts, ends), grid.approximate_frechet_many(starts, ends))
+        # The Steiner points of lazy grids count against the cache bound along with their rows
+        assert TABLE_CACHE.nbytes > sub_divide_array(curve.as_array(), STEINER_SPACING).nbytes
+        assert lazy.spine_distance == grid.spine_distance
+        assert np.array_equal(lazy.table(), grid.distances)
+
+    def test_distances_in_blocks(self):
+        curve = PolygonalCurve2D([
+            Point2D(-5.0, 1.0),
+            Point2D(-4.0, 4.0),
+            Point2D(-2.0, -1.0)
+        ])
+        grid = FrechetGrid2D(curve, self.error)
+
+        # Fewer cells than G(v) has points, so the table is filled in one row of G(u) at a time
+        max_cells = frechet_grid.MAX_BATCH_CELLS
+        frechet_grid.MAX_BATCH_CELLS = 7
+        try:
+            blocks = FrechetGrid2D(curve, self.error)
+        finally:
+            frechet_grid.MAX_BATCH_CELLS = max_cells
+
+        assert blocks.distances.shape == grid.distances.shape
+        assert np.array_equal(blocks.distances, grid.distances)
+
+    def test_segment_grid(self):
+        edge = Edge2D(Point2D(-5.0, 1.0), Point2D(-4.0, 4.0))
+        grid = SegmentFrechetGrid2D(edge)
+        starts = np.array([[-5.0, 3.5], [-5.0, 1.0], [-20.0, -22.0], [-4.0, 2.0]])
+        ends = np.array([[-2.0, -3.5], [-4.0, 4.0], [5.0, 5.0], [-1.0, -2.0]])
+
+        estimates = grid.approximate_frechet_many(starts, ends)
+
+        for k in range(0, len(starts)):
+            e = Edge2D(Point2D(*starts[k]), Point2D(*ends[k]))
+            real = continuous_frechet_segments(starts[k:k + 1], ends[k:k + 1], edge.as_array())[0]
+            assert abs(estimates[k] - grid.approximate_frechet(e)) < 1e-12
+            assert abs(estimates[k] - real) < 1e-9
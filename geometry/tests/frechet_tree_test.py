@@ -1,7 +1,15 @@
 import json
+import os
+import shutil
+import tempfile
 import unittest
 
-from geometry.utils.tree_reader import create_tree
+import numpy as np
+
+from geometry.data_structures.curve import Edge2D
+from geometry.data_structures.frechet_tree import FrechetTree
+from geometry.data_structures.point import Point2D
+from geometry.utils.tree_reader import create_array_tree, create_tree
 
 
 class TestFrechetTree(unittest.TestCase):
@@ -13,3 +21,57 @@ class TestFrechetTree(unittest.TestCase):
 
     def test_nothing(self):
         pass
+
+    def test_query_along_path(self):
+        self.__query_along_path(self.tree)
+
+    def test_query_array_tree(self):
+        self.__query_along_path(create_array_tree(json.load(open('trees/tree_a.json'))))
+
+    def __query_along_path(self, tree):
+        frechet_tree = FrechetTree(tree, self.error, self.delta)
+        nodes = dict(((n.point.x, n.point.y), n) for n in tree.depth_first_search(tree.root))
+
+        # x and y lie on the edges above (5, 0) and (5, -1), along the same path of the decomposition
+        x = Point2D(4.5, 0.0)
+        y = Point2D(5.0, -0.5)
+        x_node = nodes[(5.0, 0.0)]
+        y_node = nodes[(5.0, -1.0)]
+
+        q_edge = Edge2D(Point2D(4.5, 0.25), Point2D(5.0, -0.75))
+        assert frechet_tree.is_approximate(q_edge, x, y, x_node, y_node)
+        assert frechet_tree.is_approximate(Edge2D(q_edge.p2, q_edge.p1), y, x, y_node, x_node)
+
+        # The start of q_edge lies 3 away from x, further than (1 + error) * delta
+        q_edge = Edge2D(Point2D(4.5, 3.0), Point2D(5.0, -0.75))
+        assert not frechet_tree.is_approximate(q_edge, x, y, x_node, y_node)
+        assert not frechet_tree.is_approximate(Edge2D(q_edge.p2, q_edge.p1), y, x, y_node, x_node)
+
+    def test_parallel_build(self):
+        serial = FrechetTree(self.tree, self.error, self.delta)
+        parallel = FrechetTree(create_tree(json.load(open('trees/tree_a.json'))), self.error, self.delta, workers=2)
+        assert sorted(parallel.path_trees.keys()) == sorted(serial.path_trees.keys())
+
+        for key, path_tree in serial.path_trees.items():
+            serial_nodes = list(path_tree.post_order_traversal(path_tree.root))
+            parallel_nodes = list(parallel.path_trees[key].post_order_traversal(parallel.path_trees[key].root))
+            assert len(serial_nodes) == len(parallel_nodes)
+
+            for a, b in zip(serial_nodes, parallel_nodes):
+                assert a.grid.spine_distance == b.grid.spine_distance
+                assert np.array_equal(a.grid.distances, b.grid.distances)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'tree.bin')
+        frechet_tree = FrechetTree(self.tree, self.error, self.delta)
+
+        try:
+            frechet_tree.save(path)
+            loaded = FrechetTree.load(path)
+
+            assert sorted(loaded.path_trees.keys()) == sorted(frechet_tree.path_trees.keys())
+            assert [str(n.point) for n in loaded.tree.depth_first_search(loaded.tree.root)] == \
+                [str(n.point) for n in frechet_tree.tree.depth_first_search(frechet_tree.tree.root)]
+        finally:
+            shutil.rmtree(directory)
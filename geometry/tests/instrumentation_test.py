@@ -0,0 +1,94 @@
+import unittest
+
+from geometry.data_structures.curve import Edge2D, PolygonalCurve2D
+from geometry.data_structures.curve_range_tree import CurveRangeTree2D
+from geometry.data_structures.point import Point2D
+from geometry.utils import instrumentation
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = CurveRangeTree2D(
+            PolygonalCurve2D([
+                Point2D(0.0, 0.0),
+                Point2D(5.0, 0.0),
+                Point2D(5.0, 5.0),
+                Point2D(1.0, 5.0),
+                Point2D(1.0, 1.0)
+            ]),
+            1.0, 1.0)
+
+        self.query = (
+            Edge2D(Point2D(2.5, -1.0), Point2D(5.5, 2.5)),
+            Point2D(2.5, 0.0),
+            Point2D(5.0, 2.5),
+            Edge2D(Point2D(0.0, 0.0), Point2D(5.0, 0.0)),
+            Edge2D(Point2D(5.0, 0.0), Point2D(5.0, 5.0))
+        )
+
+    def test_disabled(self):
+        assert instrumentation.STATS is None
+        self.tree.is_approximate(*self.query)
+        assert instrumentation.STATS is None
+
+    def test_query_stats(self):
+        queries = list()
+        with instrumentation.instrumented(queries.append) as stats:
+            answer = self.tree.is_approximate(*self.query)
+            self.tree.is_approximate(*self.query)
+
+        assert instrumentation.STATS is None
+        assert answer == self.tree.is_approximate(*self.query)
+
+        assert len(queries) == 2 and queries[0]['counts'] == queries[1]['counts']
+        assert stats.counts['queries'] == 2
+        for stage in ['partition_path', 'partition', 'dag']:
+            assert stats.counts[stage + '_calls'] == 2
+            assert stats.seconds[stage] == sum(q['seconds'][stage] for q in queries)
+
+        assert queries[0]['counts']['dag_vertices'] > 2
+        assert queries[0]['counts']['dag_edges'] > 0
+        assert stats.as_dict()['counts'] == dict(stats.counts)
+
+    def test_prefilter_stats(self):
+        # P[x, y] reaches (1, 5), far from the query segment, so the grids are never looked up
+        query = (Edge2D(Point2D(2.5, -2.0), Point2D(5.5, -0.5)), Point2D(2.5, 0.0), Point2D(1.0, 2.5),
+                 Edge2D(Point2D(0.0, 0.0), Point2D(5.0, 0.0)), Edge2D(Point2D(1.0, 5.0), Point2D(1.0, 1.0)))
+
+        with instrumentation.instrumented() as stats:
+            assert not self.tree.is_approximate(*query)
+            self.tree.is_approximate(*self.query)
+
+        # Both queries are counted, although only one of them reaches the grids
+        assert stats.counts['queries'] == 2 and stats.counts['prefilter_calls'] == 2
+        assert stats.counts['prefiltered'] == 1 and stats.counts['prefilter_rejections'] == 1
+        assert stats.counts['dag_calls'] == 1
+
+    def test_batch_stats(self):
+        rejected = (Edge2D(Point2D(2.5, -2.0), Point2D(5.5, -0.5)), Point2D(2.5, 0.0), Point2D(1.0, 2.5),
+                    Edge2D(Point2D(0.0, 0.0), Point2D(5.0, 0.0)), Edge2D(Point2D(1.0, 5.0), Point2D(1.0, 1.0)))
+        queries = [self.query, rejected, self.query, rejected, rejected]
+
+        with instrumentation.instrumented() as single:
+            for query in queries:
+                self.tree.is_approximate(*query)
+
+        with instrumentation.instrumented() as batch:
+            self.tree.is_approximate_many(
+                [[[q.p1.x, q.p1.y], [q.p2.x, q.p2.y]] for q, _, _, _, _ in queries],
+                [[x.x, x.y] for _, x, _, _, _ in queries],
+                [[y.x, y.y] for _, _, y, _, _ in queries],
+                [[[e.p1.x, e.p1.y], [e.p2.x, e.p2.y]] for _, _, _, e, _ in queries],
+                [[[e.p1.x, e.p1.y], [e.p2.x, e.p2.y]] for _, _, _, _, e in queries]
+            )
+
+        # Every query of the batch is counted once, as when they are made one at a time
+        assert batch.counts['queries'] == 5 and batch.counts['prefilter_calls'] == 5
+        assert batch.counts['prefiltered'] == 3 and batch.counts['prefilter_rejections'] == 3
+        for name in ['queries', 'prefilter_calls', 'prefiltered', 'prefilter_rejections', 'subpaths']:
+            assert batch.counts[name] == single.counts[name]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from geometry import GeometryException
+from geometry.utils.storage import read_arrays, write_arrays
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'arrays.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        arrays = {
+            'a': np.arange(10, dtype=np.int64),
+            'b': np.linspace(0, 1, 12, dtype=np.float32).reshape(3, 4),
+            'c': np.empty((0, 0))
+        }
+        write_arrays(self.path, arrays, {'error': 0.5})
+
+        for mmap in [True, False]:
+            metadata, loaded = read_arrays(self.path, mmap)
+
+            assert metadata == {'error': 0.5}
+            for name, array in arrays.items():
+                assert loaded[name].dtype == array.dtype
+                assert np.array_equal(loaded[name], array)
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 64)
+
+        self.assertRaises(GeometryException, read_arrays, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
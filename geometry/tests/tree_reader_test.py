@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from geometry import GeometryException
+from geometry.utils.tree_reader import create_array_tree, create_tree, read_edge_list, read_parent_array
+
+
+class TestTreeReader(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.json = {'root': {'x': 0.0, 'y': 1.0, 'children': [
+            {'x': 1.0, 'y': 1.0, 'children': [{'x': 2.0, 'y': 2.0, 'children': []}]},
+            {'x': -1.0, 'y': 1.0, 'children': []}
+        ]}}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_create_tree(self):
+        tree = create_tree(self.json)
+        array_tree = create_array_tree(self.json)
+
+        assert str(tree.root.point) == str(array_tree.root.point) == '(0.0, 1.0)'
+        assert [str(n.point) for n in tree.depth_first_search(tree.root)] == \
+            [str(n.point) for n in array_tree.depth_first_search(array_tree.root)]
+
+    def test_read_edge_list(self):
+        path = os.path.join(self.directory, 'edges.txt')
+        with open(path, 'w') as f:
+            f.write('# x1 y1 x2 y2\n0 1 1 1\n1 1 2 2\n\n0 1 -1 1\n')
+
+        tree = read_edge_list(path, chunk_lines=2)
+        expected = create_array_tree(self.json)
+
+        assert np.array_equal(tree.coordinates, expected.coordinates)
+        assert np.array_equal(tree.parents, expected.parents)
+
+    def test_read_edge_list_multiple_parents(self):
+        path = os.path.join(self.directory, 'edges.txt')
+        with open(path, 'w') as f:
+            f.write('0 0 1 1\n2 2 1 1\n')
+
+        self.assertRaises(GeometryException, read_edge_list, path)
+
+    def test_read_parent_array(self):
+        expected = create_array_tree(self.json)
+        parents_path = os.path.join(self.directory, 'parents.npy')
+        coordinates_path = os.path.join(self.directory, 'coordinates.npy')
+        np.save(parents_path, expected.parents)
+        np.save(coordinates_path, expected.coordinates)
+
+        for mmap in [True, False]:
+            tree = read_parent_array(parents_path, coordinates_path, mmap)
+            tree.decompose()
+
+            assert np.array_equal(tree.parents, expected.parents)
+            assert tree.sizes.tolist() == [2, 1, 1, 1]
+
+
+if __name__ == '__main__':
+    unittest.main()
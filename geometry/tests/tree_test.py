@@ -0,0 +1,89 @@
+import json
+import unittest
+
+import numpy as np
+
+from geometry.data_structures.point import Point2D
+from geometry.data_structures.tree import ArrayTree, Tree
+from geometry.utils.tree_reader import create_tree
+
+
+class TestTree(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = create_tree(json.load(open('trees/tree_a.json')))
+
+    def test_lca_index(self):
+        self.tree.decompose(lca_index=True)
+        nodes = list(self.tree.depth_first_search(self.tree.root))
+
+        def ancestors(node):
+            seq = list()
+            while node is not None:
+                seq.append(node)
+                node = node.parent
+            return seq
+
+        for u in nodes:
+            for v in nodes:
+                expected = next(n for n in ancestors(u) if n in ancestors(v))
+                assert self.tree.lowest_common_ancestor(u, v) == expected
+
+        assert self.tree.stats['lca_index_bytes'] > 0
+
+    def test_array_tree_decompose(self):
+        array_tree = ArrayTree.from_tree(self.tree)
+        curves = self.tree.decompose(embedded_nodes=True, lca_index=True)
+        array_curves = array_tree.decompose(embedded_nodes=True, lca_index=True)
+
+        nodes = list(self.tree.depth_first_search(self.tree.root))
+        array_nodes = list(array_tree.depth_first_search(array_tree.root))
+
+        assert [str(n.point) for n in nodes] == [str(n.point) for n in array_nodes]
+        assert [(n.size, n.ell, str(n.gpar.point)) for n in nodes] == \
+            [(n.size, n.ell, str(n.gpar.point)) for n in array_nodes]
+        assert [str(c) for c in curves] == [str(c) for c in array_curves]
+
+        # Nodes list the very curves of the decomposition, which are told apart by identity
+        for n in array_nodes:
+            assert all(any(c is d for d in array_curves) for c in n.decomp_curves)
+        assert [str(n.point) for n in self.tree.post_order_traversal(self.tree.root)] == \
+            [str(array_tree.node(i).point) for i in array_tree.post_order()]
+
+        for u, array_u in zip(nodes[1:], array_nodes[1:]):
+            for v, array_v in zip(nodes[1:], array_nodes[1:]):
+                if u != v:
+                    assert str(self.tree.lowest_common_ancestor(u, v).point) == \
+                        str(array_tree.lowest_common_ancestor(array_u, array_v).point)
+
+    def test_parent_array(self):
+        points, parents = self.tree.parent_array()
+        tree = Tree.from_parent_array(points, parents)
+
+        # Nodes are numbered in pre-order, so linking them again gives back the same tree
+        assert parents[0] == -1 and np.all(parents[1:] < np.arange(1, len(parents)))
+        assert [str(n.point) for n in tree.depth_first_search(tree.root)] == \
+            [str(n.point) for n in self.tree.depth_first_search(self.tree.root)]
+        assert [[str(c.point) for c in n.children()] for n in tree.depth_first_search(tree.root)] == \
+            [[str(c.point) for c in n.children()] for n in self.tree.depth_first_search(self.tree.root)]
+
+    def test_deep_tree(self):
+        n = 20000
+        nodes = [Tree.Node(Point2D(float(i), 0.0)) for i in range(0, n)]
+        for parent, child in zip(nodes[:-1], nodes[1:]):
+            parent.left_child = child
+            child.parent = parent
+
+        tree = Tree(root=nodes[0])
+        assert len(list(tree.post_order_traversal(tree.root))) == n
+
+        array_tree = ArrayTree(np.arange(2 * n, dtype=np.float64).reshape(-1, 2), np.arange(-1, n - 1))
+        paths = array_tree.decompose(embedded_nodes=True, lca_index=True)
+
+        assert len(paths) == 1 and paths[0].size() == n
+        assert array_tree.depths[-1] == n - 1
+        assert array_tree.lowest_common_ancestor(array_tree.node(n - 1), array_tree.node(5)).index == 5
+
+
+if __name__ == '__main__':
+    unittest.main()
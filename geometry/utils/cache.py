@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A cache of NumPy arrays bounded by the total number of bytes it holds.
+
+    Once the bound is exceeded, the least recently used arrays are evicted until the cache
+    fits again. Hits and misses are counted so that the cache's effectiveness can be reported.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def get(self, key, compute):
+        """
+        Returns the array stored for key, computing and storing it with compute() on a miss.
+        """
+        value = self.__entries.get(key)
+
+        if value is not None:
+            self.hits += 1
+            self.__entries[key] = self.__entries.pop(key)
+            return value
+
+        self.misses += 1
+        value = compute()
+        self.__entries[key] = value
+        self.nbytes += value.nbytes
+
+        # The entry just added is kept even when it alone exceeds the bound
+        while self.nbytes > self.max_bytes and len(self.__entries) > 1:
+            _, evicted = self.__entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+        return value
+
+    def clear(self):
+        self.__entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+# Shared by every lazily built FrechetGrid2D
+TABLE_CACHE = LRUCache(max_bytes=256 * 2 ** 20)
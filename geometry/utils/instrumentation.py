@@ -0,0 +1,138 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from timeit import default_timer
+
+from geometry.utils.cache import TABLE_CACHE
+
+# The QueryStats collecting measurements, or None while instrumentation is disabled
+STATS = None
+
+
+class QueryStats(object):
+    """
+    Collects counters and stage timings of queries.
+
+    Instrumented code reads the module level STATS and only measures anything when it is set, so
+    disabled instrumentation costs a single attribute lookup per stage. Counters are summed into
+    counts and stage timings into seconds, each timed stage also counting its calls. Every top level
+    query is additionally reported on its own to callback, when given, as a dictionary holding its
+    counts, its seconds and the hits and misses of TABLE_CACHE during the query.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.counts = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.__depth = 0
+        self.__query = None
+
+    def count(self, name, value=1):
+        self.counts[name] += value
+        if self.__query is not None:
+            self.__query['counts'][name] += value
+
+    def lap(self, stage, start, calls=1):
+        """
+        Records the time elapsed since start, as returned by default_timer, under stage, as taken by
+        the given number of calls of the stage. Returns the current time so that consecutive stages
+        can be timed from one another.
+        """
+        now = default_timer()
+        self.seconds[stage] += now - start
+        self.count(stage + '_calls', calls)
+        if self.__query is not None:
+            self.__query['seconds'][stage] += now - start
+
+        return now
+
+    def begin_query(self):
+        self.__depth += 1
+        if self.__depth == 1:
+            self.__query = {'counts': defaultdict(int), 'seconds': defaultdict(float),
+                            'cache_hits': TABLE_CACHE.hits, 'cache_misses': TABLE_CACHE.misses}
+
+    def end_query(self):
+        self.__depth -= 1
+        if self.__depth > 0:
+            return
+
+        query = self.__query
+        self.__query = None
+        query['cache_hits'] = TABLE_CACHE.hits - query['cache_hits']
+        query['cache_misses'] = TABLE_CACHE.misses - query['cache_misses']
+        query['counts'] = dict(query['counts'])
+        query['seconds'] = dict(query['seconds'])
+
+        self.cache_hits += query['cache_hits']
+        self.cache_misses += query['cache_misses']
+        if self.callback is not None:
+            self.callback(query)
+
+    def cache_hit_rate(self):
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / float(lookups) if lookups > 0 else None
+
+    def as_dict(self):
+        return {
+            'counts': dict(self.counts),
+            'seconds': dict(self.seconds),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_hit_rate': self.cache_hit_rate()
+        }
+
+    def reset(self):
+        self.counts.clear()
+        self.seconds.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def enable(callback=None):
+    """
+    Starts collecting measurements into a new QueryStats, which is returned.
+    """
+    global STATS
+    STATS = QueryStats(callback)
+    return STATS
+
+
+def disable():
+    global STATS
+    STATS = None
+
+
+@contextmanager
+def instrumented(callback=None):
+    """
+    Collects measurements while the block runs, restoring the previous QueryStats afterwards.
+    """
+    global STATS
+    previous = STATS
+    STATS = QueryStats(callback)
+    try:
+        yield STATS
+    finally:
+        STATS = previous
+
+
+def query(f):
+    """
+    Decorates a top level query method, so that every call is reported as one query to STATS.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        stats = STATS
+        if stats is None:
+            return f(*args, **kwargs)
+
+        stats.begin_query()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            stats.end_query()
+
+    return wrapper
@@ -0,0 +1,86 @@
+import json
+import struct
+
+import numpy as np
+
+from geometry import GeometryException
+
+MAGIC = b'FMQS'
+VERSION = 1
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct('<4sIQ')
+
+
+def write_arrays(path, arrays, metadata=None):
+    """
+    Writes the named NumPy arrays to a versioned binary file at path.
+
+    The file starts with a fixed preamble holding a magic number, the format version and the
+    length of a JSON header. The header records the given metadata along with the dtype, shape
+    and offset of every array. The raw array buffers follow, each aligned to ALIGNMENT bytes so
+    they can be memory-mapped in place. Only plain data is stored, never pickled objects.
+    """
+    layout = dict()
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({'metadata': metadata or dict(), 'arrays': layout}, sort_keys=True).encode('utf-8')
+    data_start = _align(_PREAMBLE.size + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        f.write(b'\0' * (data_start - _PREAMBLE.size - len(header)))
+
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            f.seek(data_start + layout[name]['offset'])
+            f.write(array.tobytes())
+
+        # Pad the file so that the last array lies entirely within it
+        f.seek(data_start + offset)
+        f.truncate()
+
+
+def read_arrays(path, mmap=True):
+    """
+    Reads a file written by write_arrays, returning its metadata and a dictionary of its arrays.
+
+    When mmap is set, the file is memory-mapped read-only and every array is a view into the
+    mapping, so loading is independent of the size of the arrays and processes loading the same
+    file share its pages through the page cache.
+    """
+    with open(path, 'rb') as f:
+        magic, version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+
+        if magic != MAGIC:
+            raise GeometryException('{} is not a stored geometry data structure.'.format(path))
+        if version != VERSION:
+            raise GeometryException('Unsupported storage format version {} in {}.'.format(version, path))
+
+        header = json.loads(f.read(header_length).decode('utf-8'))
+
+    data_start = _align(_PREAMBLE.size + header_length)
+    if mmap:
+        buf = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        with open(path, 'rb') as f:
+            buf = np.frombuffer(f.read(), dtype=np.uint8)
+
+    arrays = dict()
+    for name, layout in header['arrays'].items():
+        dtype = np.dtype(layout['dtype'])
+        shape = tuple(layout['shape'])
+        start = data_start + layout['offset']
+        nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        arrays[name] = buf[start:start + nbytes].view(dtype).reshape(shape)
+
+    return header['metadata'], arrays
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
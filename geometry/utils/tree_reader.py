@@ -1,25 +1,111 @@
-from geometry.data_structures.tree import Tree
+from itertools import islice
+
+import numpy as np
+
+from geometry import GeometryException
+from geometry.data_structures.tree import ArrayTree, Tree, _pre_order
 from geometry.data_structures.point import Point2D
 
 
 def create_tree(json):
-    root = Tree.Node(Point2D(json['root']['x'], json['root']['x']))
-
-    def create_children(children, parent):
-        prev = None
-        first = None
-        for child in children:
-            new = Tree.Node(Point2D(child['x'], child['y']), parent=parent)
-            new.left_child = create_children(child['children'], new)
+    root = Tree.Node(Point2D(json['root']['x'], json['root']['y']))
 
-            if prev:
-                prev.right_sibling = new
-            if not first:
-                first = new
+    # Each entry holds the children left to link under a parent, along with the last child linked
+    stack = [(iter(json['root']['children']), root, None)]
+    while len(stack) > 0:
+        children, parent, prev = stack.pop()
+        child = next(children, None)
+        if child is None:
+            continue
 
-            prev = new
+        new = Tree.Node(Point2D(child['x'], child['y']), parent=parent)
+        if prev:
+            prev.right_sibling = new
+        else:
+            parent.left_child = new
 
-        return first
+        stack.append((children, parent, new))
+        stack.append((iter(child['children']), new, None))
 
-    root.left_child = create_children(json['root']['children'], root)
     return Tree(root=root)
+
+
+def create_array_tree(json):
+    """
+    Builds an ArrayTree from the same nested document as create_tree, numbering the nodes in pre-order.
+    """
+    nodes, parents = _pre_order(json['root'], lambda node: node['children'])
+    return ArrayTree(np.array([(node['x'], node['y']) for node in nodes], dtype=np.float64).reshape(-1, 2), parents)
+
+
+def read_edge_list(path, chunk_lines=1 << 20):
+    """
+    Reads a tree from a text file holding one edge per line as 'x1 y1 x2 y2', from a parent at (x1, y1)
+    to a child at (x2, y2). Nodes are identified by their coordinates and the root is the only node
+    that is never a child. Blank lines and lines starting with '#' are skipped.
+
+    The file is parsed chunk_lines lines at a time, so memory grows with the number of nodes only.
+    Nodes are numbered in order of first appearance, so the children of a node keep their order.
+    """
+    chunks = list()
+    with open(path) as f:
+        while True:
+            lines = list(islice(f, chunk_lines))
+            if len(lines) == 0:
+                break
+
+            lines = [line for line in lines if line.strip() and not line.lstrip().startswith('#')]
+            if len(lines) > 0:
+                chunks.append(np.loadtxt(lines, dtype=np.float64, ndmin=2))
+
+    edges = np.concatenate(chunks) if len(chunks) > 0 else np.empty((0, 4))
+    if edges.shape[1] != 4:
+        raise GeometryException('Edges in {} must be given as x1 y1 x2 y2.'.format(path))
+
+    return create_tree_from_edges(edges[:, :2], edges[:, 2:])
+
+
+def create_tree_from_edges(parent_points, child_points):
+    """
+    Builds an ArrayTree from (m, 2) arrays holding the coordinates of the parent and the child of every
+    edge, see read_edge_list.
+    """
+    m = len(parent_points)
+    points = np.ascontiguousarray(np.concatenate((parent_points, child_points)), dtype=np.float64)
+
+    # Complex numbers sort lexicographically by their coordinates, far faster than unique rows would
+    _, first, inverse = np.unique(points.view(np.complex128).reshape(-1), return_index=True, return_inverse=True)
+
+    # Renumber the distinct points by first appearance
+    order = np.argsort(first, kind='mergesort')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    ids = rank[inverse.reshape(-1)]
+    points = points[first[order]]
+
+    if len(np.unique(ids[m:])) != m:
+        raise GeometryException('Every node of a tree must have a single parent.')
+    if len(points) != m + 1:
+        raise GeometryException('A tree must have exactly one root.')
+
+    parents = np.full(len(points), -1, dtype=np.int64)
+    parents[ids[m:]] = ids[:m]
+    return ArrayTree(points, parents)
+
+
+def read_parent_array(parents_path, coordinates_path, mmap=True):
+    """
+    Reads a tree from two .npy files, a flat array holding the parent index of every node, with -1
+    marking the root, and an (n, 2) array holding the coordinates of every node. When mmap is set,
+    both files are memory-mapped rather than read.
+    """
+    mode = 'r' if mmap else None
+    parents = np.load(parents_path, mmap_mode=mode)
+    coordinates = np.load(coordinates_path, mmap_mode=mode)
+
+    if parents.ndim != 1 or coordinates.shape != (len(parents), 2):
+        raise GeometryException('Expected a flat array of parents along with one pair of coordinates per node.')
+    if np.count_nonzero(parents < 0) != 1:
+        raise GeometryException('A tree must have exactly one root.')
+
+    return ArrayTree(coordinates, parents)